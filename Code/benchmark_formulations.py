@@ -0,0 +1,149 @@
+import sys
+import copy
+import time
+import numpy as np
+from datetime import datetime
+
+# Compare build and solve time of the battery formulations as the horizon grows.
+# 'matrix' is the state of charge formulation built with create_matrix_model.
+# Prices are synthetic so no downloading is needed. The formulations must reach the same
+# objective, the exit code is 1 if any horizon's objectives differ.
+
+parameters = {
+    'name': 'ElectricityArbitrage',
+    'generator_name': 'SYNTHETIC',
+    'date_range': None,
+    'num_markets': 1,
+    'battery_types': {
+        'lithium': {
+            'size': 22.1,
+            'capacity': 100,
+            'charge_loss': 0.75,
+            'max_charge': 40,
+            'max_discharge': 15,
+            'cost': 12500
+        },
+        'lead': {
+            'size': 20.3,
+            'capacity': 350,
+            'charge_loss': 0.68,
+            'max_charge': 10,
+            'max_discharge': 40,
+            'cost': 11000
+        },
+        'palladium': {
+            'size': .1,
+            'capacity': 5,
+            'charge_loss': 0.33,
+            'max_charge': 5,
+            'max_discharge': 5,
+            'cost': 50
+        }
+    },
+    'battery_types_used': ['lithium', 'lead', 'palladium'],
+    'battery_counts': None,
+    'warehouse_data': [
+        {'area': 100, 'cost': 30000},
+        {'area': 100, 'cost': 50000},
+        {'area': 100, 'cost': 100000},
+        {'area': 100, 'cost': 300000},
+        {'area': 100, 'cost': 8000000}
+    ],
+    'warehouses_used': None,
+    'carry_over': False
+}
+
+horizons_in_days = [1, 7, 30, 90]
+formulations = ['cumulative', 'state_of_charge', 'matrix']
+
+# Skip the cumulative formulation past this many days, it takes too long to build
+max_cumulative_days = 30
+
+
+def make_synthetic_prices(num_days, start_date=datetime(2023, 1, 1), seed=0):
+    rng = np.random.default_rng(seed)
+
+    hours = np.arange(num_days * 24)
+
+    # Daily cycle with an evening peak plus noise, roughly the shape of NYISO day-ahead prices
+    prices = 40 + 15 * np.sin(2 * np.pi * (hours % 24 - 9) / 24) + rng.normal(0, 5, len(hours))
+
+    times = np.datetime64(start_date, 'ns') + hours.astype('timedelta64[h]')
+
+    return {
+        'times': times,
+        'prices': prices,
+        'marg_cost_loss': np.zeros(len(hours)),
+        'marg_cost_cong': np.zeros(len(hours))
+    }
+
+
+# parameters with the battery and warehouse costs scaled down to a num_days horizon (as if paid
+# off over a year), otherwise the optimal fleet is empty and every formulation solves to 0
+def horizon_parameters(num_days):
+    run_parameters = copy.deepcopy(parameters)
+
+    for battery in run_parameters['battery_types'].values():
+        battery['cost'] = battery['cost'] * num_days / 365
+
+    for warehouse in run_parameters['warehouse_data']:
+        warehouse['cost'] = warehouse['cost'] * num_days / 365
+
+    return run_parameters
+
+
+def benchmark(num_days, formulation):
+    # Imported here so make_synthetic_prices can be used without Gurobi installed
+    from run_model import create_model, create_matrix_model
+
+    run_parameters = horizon_parameters(num_days)
+
+    prices_dict = make_synthetic_prices(num_days)
+
+    start = time.perf_counter()
+    if formulation == 'matrix':
+        [model, _, _] = create_matrix_model(run_parameters, prices_dict)
+    else:
+        run_parameters['formulation'] = formulation
+        [model, _, _] = create_model(run_parameters, prices_dict)
+    build_time = time.perf_counter() - start
+
+    model.setParam('OutputFlag', 0)
+
+    start = time.perf_counter()
+    model.optimize()
+    solve_time = time.perf_counter() - start
+
+    return {
+        'days': num_days,
+        'formulation': formulation,
+        'nonzeros': model.NumNZs,
+        'build_time': build_time,
+        'solve_time': solve_time,
+        'objective': model.objVal
+    }
+
+
+if __name__ == '__main__':
+    print(f"{'days':>5} {'formulation':>16} {'nonzeros':>10} {'build (s)':>10} {'solve (s)':>10} {'objective':>14}")
+
+    objectives_differ = False
+
+    for num_days in horizons_in_days:
+        objectives = []
+
+        for formulation in formulations:
+            if formulation == 'cumulative' and num_days > max_cumulative_days:
+                continue
+
+            result = benchmark(num_days, formulation)
+            objectives.append(result['objective'])
+
+            print(f"{result['days']:>5} {result['formulation']:>16} {result['nonzeros']:>10} "
+                  f"{result['build_time']:>10.3f} {result['solve_time']:>10.3f} {result['objective']:>14.2f}")
+
+        if not np.allclose(objectives, objectives[0], rtol=1e-6):
+            print('...objectives differ')
+            objectives_differ = True
+
+    sys.exit(1 if objectives_differ else 0)
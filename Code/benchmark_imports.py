@@ -0,0 +1,58 @@
+import os
+import sys
+import json
+import subprocess
+
+# Import time of the main modules, each measured in a fresh interpreter. Fails (exit code 1)
+# if a module pulls in a dependency it should only load when the code that needs it runs,
+# or if it takes longer than its budget, so slow imports don't creep back in.
+#
+#   python benchmark_imports.py
+
+# Module: (dependencies it must not import, budget in seconds)
+modules = {
+    'web_scrape_price_data': (['selenium', 'webdriver_manager', 'requests', 'pandas', 'gurobipy', 'plotly', 'matplotlib'], 1.5),
+    'run_model': (['selenium', 'webdriver_manager', 'requests', 'pandas', 'scipy', 'plotly', 'matplotlib'], 2.5),
+    'dp_dispatch': (['selenium', 'webdriver_manager', 'requests', 'pandas', 'gurobipy', 'plotly', 'matplotlib'], 1.5),
+    'solve_cache': (['selenium', 'webdriver_manager', 'requests', 'pandas', 'gurobipy', 'plotly', 'matplotlib'], 1.5),
+    'make_plots': (['selenium', 'webdriver_manager', 'requests', 'pandas', 'gurobipy', 'plotly', 'matplotlib'], 1.5),
+    'cli': (['selenium', 'webdriver_manager', 'requests', 'numpy', 'pandas', 'gurobipy', 'scipy', 'plotly', 'matplotlib'], 1.5)
+}
+
+measure_code = '''
+import sys, time, json
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': list(sys.modules)}}))
+'''
+
+def measure_import(module, repeats=3):
+    code_directory = os.path.dirname(os.path.abspath(__file__))
+    timings = []
+
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', measure_code.format(module=module)], cwd=code_directory,
+                                capture_output=True, text=True, check=True).stdout
+
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result['seconds'])
+
+    # Best of the repeats, the others mostly measure a cold disk cache
+    return min(timings), set(result['modules'])
+
+
+if __name__ == '__main__':
+    failed = False
+
+    print(f"{'module':>24} {'seconds':>8} {'budget':>7}  unexpected imports")
+
+    for module, (forbidden, budget) in modules.items():
+        seconds, loaded = measure_import(module)
+        unexpected = sorted(name for name in forbidden if name in loaded)
+
+        print(f"{module:>24} {seconds:>8.3f} {budget:>7.1f}  {', '.join(unexpected)}")
+
+        if unexpected or seconds > budget:
+            failed = True
+
+    sys.exit(1 if failed else 0)
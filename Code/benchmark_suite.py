@@ -0,0 +1,325 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+
+import web_scrape_price_data
+from benchmark_formulations import parameters, horizon_parameters, make_synthetic_prices
+from instrumentation import new_stats, stage
+
+# Offline benchmark of how model building, solving and price parsing scale. Prices are
+# synthetic, so no network is needed. Each dimension (horizon in days, number of battery types,
+# number of warehouses) is swept on its own around base_case, and parsing is timed on
+# synthetic daily CSV files of growing date ranges.
+#
+#   python benchmark_suite.py                    # run and compare against the stored baseline
+#   python benchmark_suite.py --save-baseline    # run and store the results as the new baseline
+#   python benchmark_suite.py --quick            # smaller sweep
+#
+# A result is flagged when it is more than tolerance times slower (or larger) than the baseline,
+# or when its objective changed. The exit code is 1 if anything was flagged, or if there is no
+# baseline to compare against. benchmark_baseline.json holds reference results of both solvers
+# (Gurobi with a size-limited licence) from one machine. The objectives and model sizes hold
+# anywhere, for the times and memory store a baseline of your own with --write-baseline.
+#
+# Without a working Gurobi installation the fleet is fixed to one battery of each type and
+# solved with dp_dispatch instead, so there is no build stage and the number of warehouses has
+# no effect. The same happens for single cases Gurobi fails on, e.g. with a size-limited
+# licence. Baselines are kept per solver and per machine, so save one on the machine you
+# compare on.
+
+baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+base_case = {'days': 7, 'battery_types': 3, 'warehouses': 5}
+
+sweeps = {
+    'days': [1, 7, 30, 90],
+    'battery_types': [1, 2, 3],
+    'warehouses': [1, 5, 20]
+}
+
+quick_sweeps = {
+    'days': [1, 7],
+    'battery_types': [1, 3],
+    'warehouses': [1, 5]
+}
+
+parse_days = [7, 30, 365]
+quick_parse_days = [7, 30]
+
+# Flag results this many times worse than the baseline, ignoring differences smaller than
+# the minimums (timer noise on very small cases)
+tolerance = 1.5
+min_seconds = 0.05
+min_mb = 5
+
+def available_solver():
+    try:
+        import gurobipy as gp
+
+        # Creating a model fails without a valid licence
+        gp.Model('licence_check').dispose()
+
+        return 'gurobi'
+
+    except Exception:
+        return 'dp'
+
+def cases(sweeps):
+    seen = []
+
+    for dimension, values in sweeps.items():
+        for value in values:
+            case = dict(base_case, **{dimension: value})
+
+            if case not in seen:
+                seen.append(case)
+
+    return seen
+
+def case_name(case):
+    return f"days={case['days']} battery_types={case['battery_types']} warehouses={case['warehouses']}"
+
+# Costs are scaled to the horizon like in benchmark_formulations, so Gurobi sizes a non-empty
+# fleet rather than solving a trivial model
+def case_parameters(case, solver):
+    case_params = horizon_parameters(case['days'])
+
+    case_params['battery_types_used'] = list(parameters['battery_types'])[:case['battery_types']]
+    case_params['warehouse_data'] = [{'area': 100, 'cost': 30000 * (i + 1) * case['days'] / 365}
+                                     for i in range(case['warehouses'])]
+    case_params['formulation'] = 'state_of_charge'
+    case_params['date_range'] = [date.strftime('%Y%m%d') for date in pd.date_range('20230101', periods=case['days'])]
+
+    if solver == 'dp':
+        case_params['battery_counts'] = {battery_type: 1 for battery_type in case_params['battery_types_used']}
+        case_params['warehouses_used'] = 'set'
+
+    return case_params
+
+def _solve(case_params, prices_dict, solver, trace_memory):
+    if solver == 'gurobi':
+        from run_model import run
+
+        case_params['trace_memory'] = trace_memory
+        [model, _, model_results, _] = run(case_params, prices_dict=prices_dict)
+
+        if model_results is None:
+            raise RuntimeError(f'No solution found (Gurobi status {model.status})')
+
+        return model_results['stats'], model_results['total_profit']
+
+    from dp_dispatch import solve_dispatch
+
+    stats = new_stats()
+
+    with stage(stats, 'solve', trace_memory):
+        [model_results, _] = solve_dispatch(case_params, prices_dict)
+
+    return stats, model_results['total_profit']
+
+# Time one solve case, then repeat it with memory tracing (which slows it down) for the memory
+def benchmark_solve(case, solver):
+    prices_dict = make_synthetic_prices(case['days'])
+
+    stats, objective = _solve(case_parameters(case, solver), prices_dict, solver, trace_memory=False)
+    memory_stats, _ = _solve(case_parameters(case, solver), prices_dict, solver, trace_memory=True)
+
+    result = {'objective': objective}
+
+    for stage_name in ['build', 'solve']:
+        if stage_name in stats['stages']:
+            result[f'{stage_name}_seconds'] = stats['stages'][stage_name]['seconds']
+            result[f'{stage_name}_mb'] = memory_stats['stages'][stage_name]['peak_traced_mb']
+
+    if stats['gurobi']:
+        result['num_constrs'] = stats['gurobi']['num_constrs']
+        result['num_vars'] = stats['gurobi']['num_vars']
+        result['num_nonzeros'] = stats['gurobi']['num_nonzeros']
+
+    return result
+
+# Write num_days of synthetic prices as daily generator files and time reading them back
+def benchmark_parse(num_days):
+    prices_dict = make_synthetic_prices(num_days)
+    times = pd.DatetimeIndex(prices_dict['times'])
+
+    price_df = pd.DataFrame({
+        'time': times.strftime('%m/%d/%Y %H:%M'),
+        'LB_MargPrice': prices_dict['prices'].round(2),
+        'MargCostLosses': prices_dict['marg_cost_loss'],
+        'MargCostCongestion': prices_dict['marg_cost_cong']
+    })
+
+    dates = times.strftime('%Y%m%d')
+    date_range = list(dict.fromkeys(dates))
+
+    temporary_directory = tempfile.mkdtemp()
+    original_directory = web_scrape_price_data.storage_directory
+
+    try:
+        for date, day_df in price_df.groupby(dates):
+            day_df.to_csv(f'{temporary_directory}/{date}_SYNTHETIC.csv', index=False)
+
+        web_scrape_price_data.storage_directory = temporary_directory
+
+        stats = new_stats()
+
+        with stage(stats, 'parse'):
+            web_scrape_price_data.extract_time_series_prices(date_range, 'SYNTHETIC')
+
+        with stage(stats, 'parse_traced', trace_memory=True):
+            web_scrape_price_data.extract_time_series_prices(date_range, 'SYNTHETIC')
+
+    finally:
+        web_scrape_price_data.storage_directory = original_directory
+        shutil.rmtree(temporary_directory)
+
+    return {
+        'parse_seconds': stats['stages']['parse']['seconds'],
+        'parse_mb': stats['stages']['parse_traced']['peak_traced_mb']
+    }
+
+# Name and result of one solve case. Cases Gurobi can't solve (e.g. larger than a size-limited
+# licence allows) are benchmarked with dp instead, under a dp name.
+def run_case(case, solver):
+    name = f'{solver} solve {case_name(case)}'
+
+    try:
+        return name, benchmark_solve(case, solver)
+
+    except Exception as error:
+        if solver == 'gurobi':
+            import gurobipy as gp
+
+            if isinstance(error, gp.GurobiError):
+                print(f'{name:<60} Gurobi failed ({error}), solving with dp instead')
+
+                return run_case(case, 'dp')
+
+        return name, {'error': str(error)}
+
+def run_benchmarks(solver, quick=False):
+    results = {}
+
+    for case in cases(quick_sweeps if quick else sweeps):
+        name, results[name] = run_case(case, solver)
+
+        print_result(name, results[name])
+
+    for num_days in (quick_parse_days if quick else parse_days):
+        name = f'parse days={num_days}'
+
+        results[name] = benchmark_parse(num_days)
+        print_result(name, results[name])
+
+    return results
+
+def print_result(name, result):
+    if 'error' in result:
+        print(f'{name:<60} failed: {result["error"]}')
+        return
+
+    metrics = ' '.join(f'{key}={value:.3f}' if isinstance(value, float) else f'{key}={value}'
+                       for key, value in result.items())
+
+    print(f'{name:<60} {metrics}')
+
+# Names of the cases and metrics that got worse than the baseline
+def compare(results, baseline):
+    regressions = []
+
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+
+        baseline_result = baseline[name]
+
+        if 'error' in result and 'error' not in baseline_result:
+            regressions.append(f'{name}: failed ({result["error"]})')
+            continue
+
+        for metric, value in result.items():
+            if metric not in baseline_result or metric == 'error':
+                continue
+
+            reference = baseline_result[metric]
+
+            if metric == 'objective':
+                if not np.isclose(value, reference, rtol=1e-6, atol=1e-6):
+                    regressions.append(f'{name}: objective changed from {reference:.4f} to {value:.4f}')
+            elif metric.endswith('_seconds'):
+                if value > tolerance * reference and value - reference > min_seconds:
+                    regressions.append(f'{name}: {metric} {reference:.3f} -> {value:.3f}')
+            elif metric.endswith('_mb'):
+                if value > tolerance * reference and value - reference > min_mb:
+                    regressions.append(f'{name}: {metric} {reference:.1f} -> {value:.1f}')
+            elif value > reference:
+                # Model size (rows, columns, nonzeros) should not grow at all
+                regressions.append(f'{name}: {metric} {reference} -> {value}')
+
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark model building, solving and price parsing')
+    parser.add_argument('--save-baseline', '--write-baseline', action='store_true',
+                        help='store the results as the new baseline')
+    parser.add_argument('--baseline', default=baseline_path, help='baseline file to compare against')
+    parser.add_argument('--quick', action='store_true', help='run a smaller sweep')
+    parser.add_argument('--solver', choices=['gurobi', 'dp'], default=None, help='default: gurobi if available')
+
+    args = parser.parse_args(argv)
+
+    solver = args.solver or available_solver()
+    print(f'Solver: {solver}')
+
+    if solver == 'gurobi':
+        import gurobipy as gp
+
+        gp.setParam('OutputFlag', 0)
+
+    results = run_benchmarks(solver, quick=args.quick)
+
+    if args.save_baseline:
+        baseline = {}
+
+        # Keep the cases of the other solver (or the full sweep when running --quick)
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as baseline_file:
+                baseline = json.load(baseline_file)
+
+        baseline.update(results)
+
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+
+        print(f'Saved baseline to {args.baseline}')
+        return 0
+
+    # Without a baseline nothing can be flagged, so don't let it pass silently
+    if not os.path.exists(args.baseline):
+        print(f'No baseline at {args.baseline} to compare against. On the first run on a machine, store one '
+              f'with\n\n  python benchmark_suite.py --write-baseline{" --quick" if args.quick else ""}\n\n'
+              f'and run again without it to compare against it.')
+        return 1
+
+    with open(args.baseline) as baseline_file:
+        regressions = compare(results, json.load(baseline_file))
+
+    if regressions:
+        print(f'\n{len(regressions)} regressions against {args.baseline}:')
+        for regression in regressions:
+            print(f'  {regression}')
+
+        return 1
+
+    print(f'\nNo regressions against {args.baseline}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
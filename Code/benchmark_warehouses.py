@@ -0,0 +1,64 @@
+import copy
+import numpy as np
+import gurobipy as gp
+
+from run_model import run
+from benchmark_formulations import parameters, make_synthetic_prices
+
+# Solve time of stage one with and without the warehouse reduction (one integer count per
+# distinct area instead of one binary per warehouse) as the warehouse catalogue grows. The
+# catalogues have a few distinct areas with random costs, so most warehouses are
+# interchangeable apart from their cost. Battery costs are scaled down to the length of the
+# horizon (as if paid off over a year), so the fleet and the warehouses aren't trivially empty.
+#
+#   python benchmark_warehouses.py
+
+catalogue_sizes = [5, 20, 50, 100]
+areas = [50, 100, 200]
+num_days = 7
+
+
+def make_catalogue(num_warehouses, seed=0):
+    rng = np.random.default_rng(seed)
+
+    return [{'area': int(rng.choice(areas)), 'cost': int(rng.integers(20, 80)) * 1000} for _ in range(num_warehouses)]
+
+
+def benchmark(num_warehouses, warehouse_reduction):
+    run_parameters = copy.deepcopy(parameters)
+    run_parameters['formulation'] = 'state_of_charge'
+    run_parameters['warehouse_data'] = make_catalogue(num_warehouses)
+    run_parameters['warehouse_reduction'] = warehouse_reduction
+
+    for battery in run_parameters['battery_types'].values():
+        battery['cost'] = battery['cost'] * num_days / 365
+
+    [model, decision_var_dict, model_results, _] = run(run_parameters, prices_dict=make_synthetic_prices(num_days))
+
+    stats = model_results['stats']
+
+    return {
+        'warehouses': num_warehouses,
+        'reduction': warehouse_reduction,
+        'build_time': stats['stages']['build']['seconds'],
+        'solve_time': stats['gurobi']['solve_seconds'],
+        'nodes': stats['gurobi'].get('node_count', 0),
+        'objective': model_results['total_profit'],
+        'warehouses_used': [round(var.x) for var in decision_var_dict['warehouses_used'].values()]
+    }
+
+
+if __name__ == '__main__':
+    gp.setParam('OutputFlag', 0)
+
+    print(f"{'warehouses':>10} {'reduction':>10} {'build (s)':>10} {'solve (s)':>10} {'nodes':>8} {'objective':>14}")
+
+    for num_warehouses in catalogue_sizes:
+        results = [benchmark(num_warehouses, warehouse_reduction) for warehouse_reduction in [False, True]]
+
+        for result in results:
+            print(f"{result['warehouses']:>10} {str(result['reduction']):>10} {result['build_time']:>10.3f} "
+                  f"{result['solve_time']:>10.3f} {result['nodes']:>8.0f} {result['objective']:>14.2f}")
+
+        if not np.isclose(results[0]['objective'], results[1]['objective']):
+            print('...objectives differ')
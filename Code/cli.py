@@ -0,0 +1,308 @@
+import os
+import sys
+import copy
+import json
+import argparse
+import traceback
+from datetime import datetime
+
+# Command line entry point that runs scenarios from YAML or JSON job files without editing
+# any Python, e.g.
+#
+#   python cli.py download jobs/example_job.yaml
+#   python cli.py solve jobs/example_job.yaml --output results/ --plot
+#   python cli.py backtest jobs/example_job.yaml --output results/
+#   python cli.py pipeline jobs/example_job.yaml --output results/
+#   python cli.py plot jobs/example_job.yaml --output results/
+#
+# A job file holds the model parameters, the dates and optionally a list of scenarios, each
+# with a name and parameter overrides:
+#
+#   parameters: {...same keys as the parameters dict in example.py...}
+#   start_date: '20231101'
+#   end_date: '20231130'
+#   backtest: {window_hours: 48, commit_hours: 24}
+#   pipeline: {max_ahead: 2, download_batch: 1}
+#   scenarios:
+#     - name: base
+#     - name: carry_over
+#       parameters: {carry_over: true}
+#
+# Everything runs headless: results and plots are written to the output directory. numpy and
+# pandas (and the modules that need them) are imported by the subcommands, so --help is quick.
+
+def load_job(path):
+    with open(path) as job_file:
+        if path.endswith(('.yaml', '.yml')):
+            import yaml
+
+            return yaml.safe_load(job_file)
+
+        return json.load(job_file)
+
+def job_dates(job):
+    if 'date_range' in job:
+        return [str(date) for date in job['date_range']]
+
+    import pandas as pd
+
+    dates = pd.date_range(str(job['start_date']), str(job['end_date']))
+
+    return [date.strftime('%Y%m%d') for date in dates]
+
+# One parameters dict per scenario, the scenario overrides merged over the job's parameters
+def job_scenarios(job):
+    scenarios = job.get('scenarios') or [{'name': 'default'}]
+
+    for i, scenario in enumerate(scenarios):
+        parameters = copy.deepcopy(job['parameters'])
+        parameters.update(copy.deepcopy(scenario.get('parameters', {})))
+        parameters['date_range'] = job_dates(job)
+
+        yield scenario.get('name', f'scenario_{i}'), parameters
+
+def _write_json(path, data):
+    import numpy as np
+
+    with open(path, 'w') as json_file:
+        json.dump(data, json_file, indent=2, default=lambda value: value.tolist() if isinstance(value, np.ndarray) else float(value))
+
+def _write_results(output_directory, model_results, constraint_params):
+    from run_model import results_to_frame
+
+    results_to_frame(model_results, constraint_params).to_csv(os.path.join(output_directory, 'results.csv'))
+
+def _use_headless_backend():
+    import matplotlib
+
+    matplotlib.use('Agg')
+
+def download(job, output_directory, args):
+    from web_scrape_price_data import download_price_data
+
+    generator_names = set()
+    for _, parameters in job_scenarios(job):
+        generator_name = parameters['generator_name']
+        generator_names |= {generator_name} if isinstance(generator_name, str) else set(generator_name)
+
+    download_price_data(job_dates(job), sorted(generator_names) if len(generator_names) > 1 else generator_names.pop())
+
+def solve(job, output_directory, args):
+    from run_model import run
+
+    failed = []
+
+    for name, parameters in job_scenarios(job):
+        scenario_directory = os.path.join(output_directory, name)
+        os.makedirs(scenario_directory, exist_ok=True)
+
+        try:
+            [model, decision_var_dict, model_results, constraint_params] = run(parameters)
+
+            if model_results is None:
+                raise RuntimeError(f'No solution found (Gurobi status {model.status})')
+
+            summary = {
+                'scenario': name,
+                'date_range': parameters['date_range'],
+                'total_profit': model_results['total_profit'],
+                'battery_counts': parameters['battery_counts'] or decision_var_dict['battery_counts'],
+                'warehouses_used': [var.x for var in decision_var_dict['warehouses_used'].values()]
+                                   if 'warehouses_used' in decision_var_dict else parameters['warehouses_used'],
+                'stats': model_results['stats']
+            }
+
+            _write_json(os.path.join(scenario_directory, 'summary.json'), summary)
+            _write_results(scenario_directory, model_results, constraint_params)
+
+            if args.plot:
+                from make_plots import plot_result_time_series
+
+                _use_headless_backend()
+                plot_result_time_series(model, decision_var_dict, model_results, constraint_params,
+                                        save_path=os.path.join(scenario_directory, 'results.png'))
+
+            print(f'Solved scenario {name}: total profit {model_results["total_profit"]:,.2f}')
+
+        except Exception:
+            traceback.print_exc()
+            failed.append(name)
+
+    return failed
+
+# Size the fleet on the 30 days before the first date, then backtest it over the job's dates
+# with the rolling horizon engine
+def backtest(job, output_directory, args):
+    import pandas as pd
+    from two_stage import stage_one
+    from rolling_horizon import run_rolling_horizon
+
+    settings = job.get('backtest', {})
+    failed = []
+
+    for name, parameters in job_scenarios(job):
+        scenario_directory = os.path.join(output_directory, name)
+        os.makedirs(scenario_directory, exist_ok=True)
+
+        try:
+            date_range = parameters['date_range']
+
+            if parameters['battery_counts'] is None:
+                [_, decision_var_dict, _, _] = stage_one(datetime.strptime(date_range[0], '%Y%m%d'), parameters)
+
+                parameters['battery_counts'] = decision_var_dict['battery_counts']
+                parameters['warehouses_used'] = [var.x for var in decision_var_dict['warehouses_used'].values()]
+
+            parameters['date_range'] = date_range
+
+            [model_results, constraint_params] = run_rolling_horizon(parameters,
+                                                                     window_hours=settings.get('window_hours', 24),
+                                                                     commit_hours=settings.get('commit_hours', 24))
+
+            daily_profits = pd.Series(model_results['profit_ts'],
+                                      index=pd.DatetimeIndex(constraint_params['price_times'])).resample('D').sum()
+
+            summary = {
+                'scenario': name,
+                'date_range': date_range,
+                'total_profit': model_results['total_profit'],
+                'battery_counts': parameters['battery_counts'],
+                'warehouses_used': parameters['warehouses_used'],
+                'daily_profits': daily_profits.values
+            }
+
+            _write_json(os.path.join(scenario_directory, 'summary.json'), summary)
+            _write_results(scenario_directory, model_results, constraint_params)
+
+            if args.plot:
+                from make_plots import plot_waterfall_chart
+
+                warehouses_used = parameters['warehouses_used'] if isinstance(parameters['warehouses_used'], list) else []
+
+                plot_waterfall_chart(parameters, {'warehouses_used': dict(enumerate(warehouses_used))},
+                                     list(daily_profits.values), save_path=os.path.join(scenario_directory, 'profits.html'))
+
+            print(f'Backtested scenario {name}: total profit {model_results["total_profit"]:,.2f}')
+
+        except Exception:
+            traceback.print_exc()
+            failed.append(name)
+
+    return failed
+
+# Size the fleet on the 30 days before the first date, then download, parse and solve the job's
+# dates day by day with the three stages overlapped
+def pipeline(job, output_directory, args):
+    from two_stage import stage_one
+    from pipeline import run_pipeline
+
+    settings = job.get('pipeline', {})
+    failed = []
+
+    for name, parameters in job_scenarios(job):
+        scenario_directory = os.path.join(output_directory, name)
+        os.makedirs(scenario_directory, exist_ok=True)
+
+        try:
+            date_range = parameters['date_range']
+
+            if parameters['battery_counts'] is None:
+                [_, decision_var_dict, _, _] = stage_one(datetime.strptime(date_range[0], '%Y%m%d'), parameters)
+
+                parameters['battery_counts'] = decision_var_dict['battery_counts']
+                parameters['warehouses_used'] = [var.x for var in decision_var_dict['warehouses_used'].values()]
+
+            result = run_pipeline(parameters, date_range, max_ahead=settings.get('max_ahead', 2),
+                                  download_batch=settings.get('download_batch', 1))
+
+            summary = {
+                'scenario': name,
+                'date_range': date_range,
+                'total_profit': result['total_profit'],
+                'battery_counts': parameters['battery_counts'],
+                'warehouses_used': parameters['warehouses_used'],
+                'daily_profits': result['daily_profits'],
+                'failed_dates': result['failed_dates'],
+                'stats': result['stats']
+            }
+
+            _write_json(os.path.join(scenario_directory, 'summary.json'), summary)
+
+            print(f'Pipelined scenario {name}: total profit {result["total_profit"]:,.2f}')
+
+            # Days that couldn't be downloaded or parsed fail the scenario, the others are kept
+            if len(result['failed_dates']) > 0:
+                failed.append(name)
+
+        except Exception:
+            traceback.print_exc()
+            failed.append(name)
+
+    return failed
+
+# Plot the price series of each scenario's generator over the job's dates
+def plot(job, output_directory, args):
+    import numpy as np
+    from web_scrape_price_data import load_prices
+
+    _use_headless_backend()
+    import matplotlib.pyplot as plt
+
+    dates = job_dates(job)
+
+    for name, parameters in job_scenarios(job):
+        prices_dict = load_prices(parameters, dates)
+
+        fig, ax = plt.subplots(figsize=(15, 5))
+        ax.plot(prices_dict['times'], np.transpose(prices_dict['prices']))
+
+        # One line per node when trading at several nodes
+        if 'generator_names' in prices_dict:
+            ax.legend(prices_dict['generator_names'])
+
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Price ($/MWh)')
+        ax.set_title(f'Price Time Series for {parameters["generator_name"]} from {dates[0]} to {dates[-1]}')
+
+        os.makedirs(os.path.join(output_directory, name), exist_ok=True)
+        fig.savefig(os.path.join(output_directory, name, 'prices.png'))
+        plt.close(fig)
+
+commands = {
+    'download': download,
+    'solve': solve,
+    'backtest': backtest,
+    'pipeline': pipeline,
+    'plot': plot
+}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Energy arbitrage batch runner')
+    parser.add_argument('command', choices=list(commands))
+    parser.add_argument('jobs', nargs='+', help='YAML or JSON job files')
+    parser.add_argument('--output', default='results', help='directory to write results to')
+    parser.add_argument('--plot', action='store_true', help='also save plots of the results')
+
+    args = parser.parse_args(argv)
+
+    failed = []
+
+    for job_path in args.jobs:
+        job = load_job(job_path)
+        output_directory = os.path.join(args.output, os.path.splitext(os.path.basename(job_path))[0])
+        os.makedirs(output_directory, exist_ok=True)
+
+        try:
+            failed += [f'{job_path}:{name}' for name in commands[args.command](job, output_directory, args) or []]
+        except Exception:
+            traceback.print_exc()
+            failed.append(job_path)
+
+    if failed:
+        print(f'Failed: {", ".join(failed)}')
+
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
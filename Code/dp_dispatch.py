@@ -0,0 +1,231 @@
+import numpy as np
+from fractions import Fraction
+from functools import reduce
+from math import gcd
+
+from web_scrape_price_data import download_price_data, extract_price_matrix, load_prices
+
+# Dispatch for a fixed fleet (battery_counts set, warehouses already chosen) without Gurobi.
+# Once the counts are fixed every battery type is an independent single-storage problem, so it
+# is solved by dynamic programming over a grid of charge levels, vectorized with NumPy.
+#
+# The grid step is the largest step that divides the capacity, the charge and discharge limits
+# and the starting charge. All bounds and kinks of the per-period profit then sit on the grid,
+# and the DP gives the same optimum as the LP in run_model. If that step would need more than
+# max_states levels a uniform grid is used instead, which is then an approximation.
+
+def grid_step(values, max_states):
+    capacity = values[0]
+
+    try:
+        # Largest step that divides every value, to 1e-6 precision
+        fractions = [Fraction(value).limit_denominator(10**6) for value in values if value > 0]
+        numerator = reduce(gcd, [fraction.numerator for fraction in fractions])
+        denominator = reduce(lambda a, b: a * b // gcd(a, b), [fraction.denominator for fraction in fractions])
+        step = numerator / denominator
+    except (ValueError, TypeError):
+        step = 0
+
+    if step <= 0 or capacity / step + 1 > max_states:
+        step = capacity / (max_states - 1)
+
+    return step
+
+# Per unit of price, the best (sell - buy) for a change in charge level delta: with positive
+# prices buy as little as possible, with negative prices buy as much as possible and sell the
+# surplus straight back (losing some of it to the charge loss)
+def _flows(delta, positive_price, charge_loss, max_charge, max_discharge):
+    buy_min = np.maximum(delta, 0) / charge_loss
+    buy_max = np.minimum(max_charge, max_discharge + delta) / charge_loss
+
+    buy = np.where(positive_price, buy_min, buy_max)
+    sell = charge_loss * buy - delta
+
+    return buy, np.maximum(sell, 0)
+
+# Solve one battery type for a batch of price rows. prices has shape (num_rows, num_periods),
+# returns buy, sell and level arrays of that shape and the profit of each row.
+def dp_dispatch(prices, battery, battery_count, carry_over=False, initial_level=0, max_states=2001):
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    num_rows, num_periods = prices.shape
+
+    charge_loss = battery['charge_loss']
+    capacity = battery['capacity'] * battery_count
+    max_charge = battery['max_charge'] * battery_count
+    max_discharge = battery['max_discharge'] * battery_count
+
+    buy = np.zeros((num_rows, num_periods))
+    sell = np.zeros((num_rows, num_periods))
+    level = np.zeros((num_rows, num_periods))
+
+    if capacity <= 0 or num_periods == 0:
+        return buy, sell, level, np.zeros(num_rows)
+
+    step = grid_step([capacity, max_charge, max_discharge, initial_level], max_states)
+    levels = step * np.arange(int(round(capacity / step)) + 1)
+    num_states = len(levels)
+
+    # Change in level for every (from, to) pair of states, and the pairs the charge limits allow
+    delta = levels[None, :] - levels[:, None]
+    feasible = (delta <= max_charge + 1e-9) & (delta >= -max_discharge - 1e-9)
+
+    # Profit per unit of price of each transition, for positive and negative prices
+    gain = {}
+    for positive_price in [True, False]:
+        transition_buy, transition_sell = _flows(delta, positive_price, charge_loss, max_charge, max_discharge)
+        gain[positive_price] = np.where(feasible, transition_sell - transition_buy, 0)
+
+    value = np.full((num_rows, num_states), -np.inf)
+    value[:, int(np.argmin(np.abs(levels - initial_level)))] = 0
+
+    previous_state = np.zeros((num_periods, num_rows, num_states), dtype=np.int32)
+
+    for p in range(num_periods):
+        price = prices[:, p][:, None, None]
+        transition = price * np.where(price >= 0, gain[True], gain[False])
+        transition = np.where(feasible, transition, -np.inf)
+
+        candidates = value[:, :, None] + transition
+        previous_state[p] = np.argmax(candidates, axis=1)
+        value = np.max(candidates, axis=1)
+
+        # Without carry over the batteries are empty after the first hour of each day
+        if not carry_over and p % 24 == 0:
+            value[:, 1:] = -np.inf
+
+    # Leftover charge is worth nothing, so end in whichever state is best and walk back
+    state = np.argmax(value, axis=1)
+    profit = value[np.arange(num_rows), state]
+
+    rows = np.arange(num_rows)
+    for p in range(num_periods - 1, -1, -1):
+        from_state = previous_state[p][rows, state]
+
+        level[:, p] = levels[state]
+        period_delta = levels[state] - levels[from_state]
+        buy[:, p], sell[:, p] = _flows(period_delta, prices[:, p] >= 0, charge_loss, max_charge, max_discharge)
+
+        state = from_state
+
+    return buy, sell, level, profit
+
+# Same inputs as run_model.run for a fixed fleet, returns model_results and constraint_params
+# in the same shape as run
+def solve_dispatch(parameters, prices_dict=None, max_states=2001):
+    battery_types = parameters['battery_types']
+    battery_types_used = parameters['battery_types_used']
+    battery_counts = parameters['battery_counts']
+    initial_level = parameters.get('initial_level') or {}
+
+    if battery_counts is None:
+        raise ValueError('The dynamic programming solver needs a fixed fleet, set battery_counts first')
+
+    if prices_dict is None:
+        prices_dict = load_prices(parameters)
+
+    prices = np.asarray(prices_dict['prices'], dtype=float)
+
+    # Across several nodes the fleet is shared, so the battery types are no longer independent
+    if prices.ndim != 1:
+        raise ValueError('The dynamic programming solver handles a single price series, use run for several nodes')
+
+    num_periods = len(prices)
+    parameters['num_periods'] = num_periods
+
+    model_results = {
+        'num_periods': num_periods,
+        'buy_ts': {},
+        'sell_ts': {},
+        'level_ts': {},
+        'time': list(range(num_periods)),
+        'total_profit': 0
+    }
+
+    for battery_type in battery_types_used:
+        buy, sell, level, profit = dp_dispatch(prices, battery_types[battery_type], battery_counts[battery_type],
+                                               parameters['carry_over'], initial_level.get(battery_type, 0), max_states)
+
+        model_results['buy_ts'][battery_type] = buy[0]
+        model_results['sell_ts'][battery_type] = sell[0]
+        model_results['level_ts'][battery_type] = level[0]
+        model_results['total_profit'] += float(profit[0])
+
+    constraint_params = {
+        'price_times': prices_dict['times'],
+        'prices': prices
+    }
+
+    return [model_results, constraint_params]
+
+# Dispatch a fixed fleet against many price series at once. prices is a (num_rows, num_periods)
+# matrix, e.g. one row per generator node from build_price_matrix. Rows are solved together in
+# chunks small enough to keep the (rows x states x states) transition arrays bounded in memory.
+def solve_dispatch_batch(prices, battery_types, battery_types_used, battery_counts, carry_over=False,
+                         initial_level=None, max_states=2001, max_chunk_elements=2 * 10**7):
+    prices = np.atleast_2d(np.asarray(prices, dtype=float))
+    num_rows, num_periods = prices.shape
+    initial_level = initial_level or {}
+
+    result = {
+        'buy': {},
+        'sell': {},
+        'level': {},
+        'profit_by_type': {},
+        'profit': np.zeros(num_rows)
+    }
+
+    for battery_type in battery_types_used:
+        battery = battery_types[battery_type]
+        battery_count = battery_counts[battery_type]
+
+        buy = np.zeros((num_rows, num_periods))
+        sell = np.zeros((num_rows, num_periods))
+        level = np.zeros((num_rows, num_periods))
+        profit = np.zeros(num_rows)
+
+        # Number of charge levels this battery type will use, to size the row chunks
+        step = grid_step([battery['capacity'] * battery_count, battery['max_charge'] * battery_count,
+                          battery['max_discharge'] * battery_count, initial_level.get(battery_type, 0)], max_states)
+        num_states = int(round(battery['capacity'] * battery_count / step)) + 1 if step > 0 else 1
+        chunk_rows = max(1, max_chunk_elements // (num_states * num_states))
+
+        for start in range(0, num_rows, chunk_rows):
+            rows = slice(start, min(start + chunk_rows, num_rows))
+
+            buy[rows], sell[rows], level[rows], profit[rows] = dp_dispatch(
+                prices[rows], battery, battery_count, carry_over, initial_level.get(battery_type, 0), max_states)
+
+        result['buy'][battery_type] = buy
+        result['sell'][battery_type] = sell
+        result['level'][battery_type] = level
+        result['profit_by_type'][battery_type] = profit
+        result['profit'] += profit
+
+    return result
+
+# (generators x hours) price matrix of several generators, see extract_price_matrix
+def build_price_matrix(date_range, generator_names, source='csv'):
+    prices_dict = extract_price_matrix(date_range, generator_names, source)
+
+    return prices_dict['prices'], prices_dict['times']
+
+# Rank generator nodes by the arbitrage profit a fixed fleet would make on them
+def rank_generators(parameters, generator_names, date_range=None, source='csv', max_states=2001):
+    import pandas as pd
+
+    date_range = date_range or parameters['date_range']
+
+    if source == 'csv':
+        download_price_data(date_range, list(generator_names))
+
+    matrix, _ = build_price_matrix(date_range, generator_names, source)
+
+    result = solve_dispatch_batch(matrix, parameters['battery_types'], parameters['battery_types_used'],
+                                  parameters['battery_counts'], parameters['carry_over'],
+                                  parameters.get('initial_level'), max_states)
+
+    ranking = pd.DataFrame({'generator': list(generator_names), 'profit': result['profit']})
+    for battery_type, profit in result['profit_by_type'].items():
+        ranking[f'profit_{battery_type}'] = profit
+
+    return ranking.sort_values(by='profit', ascending=False).reset_index(drop=True)
@@ -4,8 +4,6 @@ from datetime import datetime, timedelta
 from make_plots import plot_result_time_series, plot_waterfall_chart
 from two_stage import stage_one, stage_two
 
-import plotly.graph_objects as go
-
 # Set parameters for the model
 
 parameters = {
@@ -0,0 +1,96 @@
+import sys
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows, peak RSS is then left out
+    resource = None
+
+# Wall time and memory of each stage of a run (download, parse, build, solve, extract) and the
+# Gurobi statistics of the solve. run collects them into model_results['stats']:
+#
+#   {'stages': {'build': {'seconds': 0.41, 'peak_rss_mb': 212.3}, ...},
+#    'gurobi': {'num_constrs': 3624, 'num_nonzeros': 12012, 'mip_gap': 0.0, 'node_count': 1.0, ...}}
+#
+# peak_rss_mb is the high-water mark of the whole process after the stage, including memory
+# used inside Gurobi. With trace_memory the peak of Python/NumPy allocations during the stage
+# is recorded as well (peak_traced_mb), which slows the stage down so it is off by default.
+
+def new_stats():
+    return {'stages': {}, 'gurobi': {}}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # Bytes on macOS, kilobytes on Linux
+    return peak / 1024**2 if sys.platform == 'darwin' else peak / 1024
+
+@contextmanager
+def stage(stats, name, trace_memory=False):
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+
+    if started_tracing:
+        tracemalloc.start()
+    elif trace_memory:
+        tracemalloc.reset_peak()
+
+    start = time.perf_counter()
+
+    try:
+        yield
+    finally:
+        record = {'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}
+
+        if trace_memory:
+            record['peak_traced_mb'] = tracemalloc.get_traced_memory()[1] / 1024**2
+
+            if started_tracing:
+                tracemalloc.stop()
+
+        stats['stages'][name] = record
+
+# Size of the model and how the solve went
+def gurobi_stats(model):
+    stats = {
+        'status': model.Status,
+        'num_vars': model.NumVars,
+        'num_int_vars': model.NumIntVars,
+        'num_constrs': model.NumConstrs,
+        'num_nonzeros': model.NumNZs,
+        'solve_seconds': model.Runtime,
+        'iterations': model.IterCount
+    }
+
+    if model.IsMIP:
+        stats['node_count'] = model.NodeCount
+
+        if model.SolCount > 0:
+            stats['mip_gap'] = model.MIPGap
+
+    if model.SolCount > 0:
+        stats['objective'] = model.ObjVal
+
+    return stats
+
+# Append one JSON line per run, e.g. for monitoring
+def write_stats(stats, path, parameters=None):
+    record = {'timestamp': datetime.now().isoformat(timespec='seconds')}
+
+    if parameters is not None:
+        record['name'] = parameters.get('name')
+        record['generator_name'] = parameters.get('generator_name')
+        record['date_range'] = [parameters['date_range'][0], parameters['date_range'][-1]] if parameters.get('date_range') else None
+        record['num_periods'] = parameters.get('num_periods')
+
+    record.update(stats)
+
+    with open(path, 'a') as stats_file:
+        stats_file.write(json.dumps(record, default=float) + '\n')
@@ -1,13 +1,14 @@
 import numpy as np
-import pandas as pd
 from datetime import datetime
 
 from web_scrape_price_data import download_price_data, extract_time_series_prices
 
-import plotly.graph_objects as go
-import matplotlib.pyplot as plt
+# matplotlib, plotly and pandas are imported inside the plotting functions, they are slow to
+# import and most runs never plot
 
 def plot_price_time_series(d_date, generator, save_plot=True, aggregation=None):
+    import matplotlib.pyplot as plt
+
     if type(d_date) == list and len(d_date) == 2:
         plot_type = 'extended'
 
@@ -20,16 +21,16 @@ def plot_price_time_series(d_date, generator, save_plot=True, aggregation=None):
         plot_type = 'daily'
 
         # Ensure data is downloaded
-        download_price_data(d_date, generator)
+        download_price_data([d_date], generator)
         # Extract time series
-        price_df = extract_time_series_prices( d_date, generator,
+        price_df = extract_time_series_prices( [d_date], generator,
                     return_df = True, aggregation=aggregation, extended = False)
 
         date_obj = datetime.strptime(d_date, '%Y%m%d')
         date_nice_format = date_obj.strftime( '%Y-%m-%d' )
 
-    # Create datetime
-    price_df['datetime'] = pd.to_datetime(price_df['time'], format='%m/%d/%Y %H:%M:%S')
+    # Times come back already parsed
+    price_df['datetime'] = price_df['time']
 
     # Plot the time series
     agg_string = '' if aggregation is None else f'{aggregation}'
@@ -53,43 +54,59 @@ def plot_price_time_series(d_date, generator, save_plot=True, aggregation=None):
 
     return None
 
-def plot_result_time_series(model, decision_var_dict, model_results, constraint_params):
+# With save_path the figure is written to that file instead of shown, so it never blocks
+def plot_result_time_series(model, decision_var_dict, model_results, constraint_params, save_path=None):
+    import pandas as pd
+    import matplotlib.pyplot as plt
+
     # Extract data from the dictionary
     buy_ts = model_results['buy_ts']
     sell_ts = model_results['sell_ts']
     prices = constraint_params['prices']
-    dates = [datetime.strptime(date, '%m/%d/%Y %H:%M').strftime('%m/%d') for date in constraint_params['price_times']]
+    dates = pd.DatetimeIndex(constraint_params['price_times']).strftime('%m/%d')
 
     battery_types = set(buy_ts.keys()).union(set(sell_ts.keys()))
 
-    # Create a new time series 'flow_ts' for each battery
-    flow_ts = {battery: np.array(buy_ts.get(battery, [0, 0, 0, 0])) - np.array(sell_ts.get(battery, [0, 0, 0, 0]))
+    # Create a new time series 'flow_ts' for each battery, one row per node when trading at several nodes
+    flow_ts = {battery: np.atleast_2d(np.array(buy_ts.get(battery, [0, 0, 0, 0])) - np.array(sell_ts.get(battery, [0, 0, 0, 0])))
             for battery in battery_types}
+    node_prices = np.atleast_2d(prices)
+    node_names = constraint_params.get('generator_names')
 
-    # Plot the bar chart for 'flow_ts'
-    fig, ax1 = plt.subplots(figsize=(10, 6))
+    # One chart per node
+    fig, axes = plt.subplots(len(node_prices), 1, figsize=(10, 6 * len(node_prices)), squeeze=False)
     width = 0.4
     ind = np.arange(len(dates))
 
-    for i, (battery, flow) in enumerate(flow_ts.items()):
-        ax1.bar(ind + i * width, flow, width, label=f'{battery} Buy/Sell')
-
-    ax1.set_xlabel('Date')
-    ax1.set_ylabel('Buy/Sell Flow')
-    date_freq = 75
-    ax1.set_xticks(ind[::date_freq])  # Show every couple of days
-    ax1.set_xticklabels(dates[::date_freq])
-    ax1.legend(loc='upper left')
-
-    # Create a second y-axis for 'prices'
-    ax2 = ax1.twinx()
-    ax2.plot(ind, prices, color='red', label='Prices')
-    ax2.set_ylabel('Prices', color='red')
-    ax2.tick_params('y', colors='red')
-    ax2.legend(loc='upper right')
-
-    plt.title('Battery Buying/Selling and Prices Over Time')
-    plt.show()
+    for n, ax1 in enumerate(axes[:, 0]):
+        # Plot the bar chart for 'flow_ts'
+        for i, (battery, flow) in enumerate(flow_ts.items()):
+            ax1.bar(ind + i * width, flow[n], width, label=f'{battery} Buy/Sell')
+
+        ax1.set_xlabel('Date')
+        ax1.set_ylabel('Buy/Sell Flow')
+        date_freq = 75
+        ax1.set_xticks(ind[::date_freq])  # Show every couple of days
+        ax1.set_xticklabels(dates[::date_freq])
+        ax1.legend(loc='upper left')
+
+        # Create a second y-axis for 'prices'
+        ax2 = ax1.twinx()
+        ax2.plot(ind, node_prices[n], color='red', label='Prices')
+        ax2.set_ylabel('Prices', color='red')
+        ax2.tick_params('y', colors='red')
+        ax2.legend(loc='upper right')
+
+        title = 'Battery Buying/Selling and Prices Over Time'
+        ax1.set_title(title if node_names is None else f'{title}: {node_names[n]}')
+
+    fig.tight_layout()
+
+    if save_path is not None:
+        fig.savefig(save_path)
+        plt.close(fig)
+    else:
+        plt.show()
 
     # ---- PLOT TIME SERIES ON ONE GRAPH ---- #
 
@@ -161,14 +178,17 @@ def plot_result_time_series(model, decision_var_dict, model_results, constraint_
     plt.tight_layout()
     plt.show() """
 
-def plot_waterfall_chart(parameters, decision_var_dict, daily_profits):
+def plot_waterfall_chart(parameters, decision_var_dict, daily_profits, save_path=None):
+    import plotly.graph_objects as go
+
     descriptions = []
     values = []
 
     # Get warehosue cost
     descriptions.append('Warehouse Cost')
 
-    num_warehouses = sum(1 for var in decision_var_dict['warehouses_used'].values() if var.x == 1.0)
+    # Gurobi variables, or plain values for solutions loaded from disk
+    num_warehouses = sum(1 for var in decision_var_dict['warehouses_used'].values() if round(getattr(var, 'x', var)) == 1)
 
     for i in range(num_warehouses):
         warehouse_cost = parameters['warehouse_data'][i]['cost']
@@ -210,4 +230,7 @@ def plot_waterfall_chart(parameters, decision_var_dict, daily_profits):
         yaxis_title='Cumulative Profit ($)',
     )
 
-    fig.show()
\ No newline at end of file
+    if save_path is not None:
+        fig.write_html(save_path)
+    else:
+        fig.show()
\ No newline at end of file
@@ -0,0 +1,182 @@
+import time
+import queue
+import threading
+
+from web_scrape_price_data import download_prices, load_prices
+from instrumentation import new_stats
+
+# Backfill and backtest day by day with the three stages overlapped: one thread downloads the
+# price files, one parses them and the calling thread solves, so day N is solved while day N+1
+# is still downloading or being parsed. Gurobi and the downloads release the GIL, so the run
+# takes about as long as the slowest stage instead of the sum of the three.
+#
+# Each stage hands its days to the next through a queue of at most max_ahead days. A stage that
+# gets ahead waits for the next one, so memory stays bounded however long the date range is.
+# Days that fail to download or parse are skipped (with carry_over their charge carries over
+# untouched) and reported, the other days still run.
+#
+#   from pipeline import run_pipeline
+#
+#   result = run_pipeline(parameters, date_range, max_ahead=2)
+
+# Marks the end of a stage's days
+_done = object()
+
+def _put(stage_queue, item, stop):
+    # Give up when a later stage has failed, otherwise a full queue would block forever
+    while not stop.is_set():
+        try:
+            stage_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+
+    return False
+
+def _get(stage_queue, stop):
+    while not stop.is_set():
+        try:
+            return stage_queue.get(timeout=0.1)
+        except queue.Empty:
+            pass
+
+    return _done
+
+# Runs one stage on its own thread, passing (date, value, error) on to output_queue. An
+# unexpected exception stops the pipeline and is re-raised by run_pipeline.
+def _stage_thread(name, produce, output_queue, stop, errors):
+    def target():
+        try:
+            for item in produce():
+                if not _put(output_queue, item, stop):
+                    return
+        except Exception as error:
+            errors.append(error)
+            stop.set()
+        finally:
+            _put(output_queue, _done, stop)
+
+    return threading.Thread(target=target, name=f'pipeline-{name}', daemon=True)
+
+def run_pipeline(parameters, date_range=None, max_ahead=2, download_batch=1, solve_day=None):
+    from two_stage import daily_solver
+
+    date_range = date_range or parameters['date_range']
+    battery_types_used = parameters['battery_types_used']
+
+    if parameters['battery_counts'] is None:
+        raise ValueError('run_pipeline needs a fixed fleet, set battery_counts (e.g. from stage_one) first')
+
+    # solve_day(date, prices_dict, initial_level) -> (profit, final_level), see two_stage.daily_solver
+    solve_day = solve_day or daily_solver(dict(parameters, warehouses_used='set'))
+
+    stats = new_stats()
+    busy = {'download': 0.0, 'parse': 0.0, 'solve': 0.0}
+
+    stop = threading.Event()
+    errors = []
+
+    downloaded = queue.Queue(maxsize=max_ahead)
+    parsed = queue.Queue(maxsize=max_ahead)
+
+    def download():
+        # Several days per call lets download_price_data fetch them concurrently
+        for i in range(0, len(date_range), download_batch):
+            batch = date_range[i:i + download_batch]
+
+            # Nothing to download for 'store' and 'matrix', then only parsing overlaps solving
+            start = time.perf_counter()
+            failed = download_prices(parameters, batch)
+            busy['download'] += time.perf_counter() - start
+
+            for date in batch:
+                yield date, None, 'download failed' if date in failed else None
+
+    def parse():
+        while True:
+            item = _get(downloaded, stop)
+
+            if item is _done:
+                return
+
+            date, _, error = item
+
+            if error is None:
+                start = time.perf_counter()
+
+                try:
+                    prices_dict = load_prices(parameters, [date], download=False)
+                except Exception as parse_error:
+                    prices_dict, error = None, f'parse failed ({parse_error})'
+
+                busy['parse'] += time.perf_counter() - start
+
+                yield date, prices_dict, error
+            else:
+                yield date, None, error
+
+    threads = [_stage_thread('download', download, downloaded, stop, errors),
+               _stage_thread('parse', parse, parsed, stop, errors)]
+
+    wall_start = time.perf_counter()
+
+    for thread in threads:
+        thread.start()
+
+    days = []
+    initial_level = {battery_type: (parameters.get('initial_level') or {}).get(battery_type, 0)
+                     for battery_type in battery_types_used}
+
+    try:
+        while True:
+            item = _get(parsed, stop)
+
+            if item is _done:
+                break
+
+            date, prices_dict, error = item
+
+            if error is not None:
+                print(f'...Skipping {date}: {error}')
+                days.append({'date': date, 'status': 'failed', 'error': error})
+                continue
+
+            start = time.perf_counter()
+            profit, final_level = solve_day(date, prices_dict, initial_level)
+            busy['solve'] += time.perf_counter() - start
+
+            days.append({'date': date, 'status': 'ok', 'profit': profit})
+
+            # Carry the charge left at the end of the day into the next day
+            if parameters['carry_over']:
+                initial_level = final_level
+
+    finally:
+        stop.set()
+
+        for thread in threads:
+            thread.join()
+
+    if len(errors) > 0:
+        raise errors[0]
+
+    for name, seconds in busy.items():
+        stats['stages'][name] = {'seconds': seconds}
+
+    stats['wall_seconds'] = time.perf_counter() - wall_start
+
+    failed_dates = [day['date'] for day in days if day['status'] == 'failed']
+
+    print(f"\n -- Pipeline solved {len(days) - len(failed_dates)} of {len(days)} days in {stats['wall_seconds']:.1f}s "
+          f"(download {busy['download']:.1f}s, parse {busy['parse']:.1f}s, solve {busy['solve']:.1f}s) -- \n")
+
+    if len(failed_dates) > 0:
+        print(f"Failed days: {', '.join(failed_dates)}")
+
+    return {
+        'days': days,
+        'daily_profits': [day.get('profit') for day in days],
+        'total_profit': sum(day['profit'] for day in days if day['status'] == 'ok'),
+        'failed_dates': failed_dates,
+        'stats': stats
+    }
@@ -0,0 +1,414 @@
+import os
+import sys
+import glob
+import hashlib
+import sqlite3
+import argparse
+import pandas as pd
+from datetime import datetime
+
+from web_scrape_price_data import (nyiso_base_url, storage_directory, market_timezone, fetch_price_files,
+                                   save_generator_prices, load_zip_index, save_zip_index)
+
+# Incremental price ingestion for cron. A SQLite manifest records every generator-day that has
+# been ingested, with its row count, a checksum of its file and a status:
+#
+#   ok        the {date}_{generator}.csv file has one row per hour of the day (23 or 25 on DST days)
+#   invalid   the file exists but has the wrong number of rows or repeated/unparseable hours
+#   failed    the day couldn't be downloaded (error holds the reason)
+#
+# Runs for 'all' generators also keep a '*' record per day, ok once the whole day was split.
+#
+# Each run only fetches the gaps: days from the end of the last completed run up to end_date
+# that aren't ok yet, plus every earlier day still marked failed or invalid for the same
+# generators. The files of those generators are deleted and fetched again, other generators'
+# files are never touched. A lock file makes overlapping cron runs exit straight away.
+#
+#   python price_ingest.py run --start 20230101 --generators "ADK HUDSON___FALLS"
+#   python price_ingest.py run                   # from the last completed run up to today
+#   python price_ingest.py status
+#
+# Point --base-url at a local server (e.g. python -m http.server in a folder of daily CSVs and
+# monthly zips laid out like the NYISO site) to try it without the network.
+
+manifest_path = os.path.join(storage_directory, 'manifest.sqlite')
+lock_path = os.path.join(storage_directory, 'ingest.lock')
+
+schema = '''
+create table if not exists generator_days (
+    date text not null,
+    generator text not null,
+    status text not null,
+    rows integer,
+    checksum text,
+    error text,
+    updated text not null,
+    primary key (date, generator)
+);
+
+create table if not exists runs (
+    id integer primary key autoincrement,
+    start_date text not null,
+    end_date text not null,
+    generators text not null,
+    started text not null,
+    finished text,
+    status text not null,
+    failed_days integer
+);
+'''
+
+def connect(path=None):
+    connection = sqlite3.connect(path or manifest_path)
+    connection.executescript(schema)
+
+    return connection
+
+# Hours in a local calendar day, 23 or 25 when the clocks change
+def expected_rows(date):
+    day = pd.Timestamp(date).tz_localize(market_timezone)
+    next_day = (pd.Timestamp(date) + pd.Timedelta(days=1)).tz_localize(market_timezone)
+
+    return int((next_day - day) / pd.Timedelta(hours=1))
+
+def file_checksum(path):
+    digest = hashlib.sha256()
+
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+# Manifest record for one {date}_{generator}.csv file
+def validate_file(date, generator):
+    path = f'{storage_directory}/{date}_{generator}.csv'
+
+    record = {'date': date, 'generator': generator, 'rows': None, 'checksum': None, 'error': None}
+
+    if not os.path.exists(path):
+        return dict(record, status='failed', error='No file written for the generator')
+
+    try:
+        times = pd.to_datetime(pd.read_csv(path)['time'], format='%m/%d/%Y %H:%M')
+    except (KeyError, ValueError, pd.errors.ParserError) as error:
+        return dict(record, status='invalid', error=f'Unreadable file ({error})')
+
+    record['rows'] = len(times)
+    record['checksum'] = file_checksum(path)
+
+    # The repeated hour when the clocks go back shows up as a duplicate local time
+    distinct_hours = times.dt.floor('h').nunique()
+    num_hours = expected_rows(date)
+
+    if len(times) != num_hours:
+        return dict(record, status='invalid', error=f'{len(times)} rows, expected {num_hours}')
+    if distinct_hours < min(num_hours, 24) or (times.dt.strftime('%Y%m%d') != date).any():
+        return dict(record, status='invalid', error='Repeated hours or hours from another day')
+
+    return dict(record, status='ok')
+
+def save_records(connection, records):
+    updated = datetime.now().isoformat(timespec='seconds')
+
+    with connection:
+        connection.executemany('''
+            insert or replace into generator_days (date, generator, status, rows, checksum, error, updated)
+            values (:date, :generator, :status, :rows, :checksum, :error, :updated)
+        ''', [dict(record, updated=updated) for record in records])
+
+# Statuses of the manifest as {(date, generator): status}
+def manifest_statuses(connection, dates=None):
+    rows = connection.execute('select date, generator, status from generator_days').fetchall()
+
+    return {(date, generator): status for date, generator, status in rows if dates is None or date in dates}
+
+# Last run that got to the end, days it failed on are retried from the manifest anyway
+def last_completed_run(connection):
+    return connection.execute('''
+        select start_date, end_date from runs where status in ('ok', 'incomplete') order by id desc limit 1
+    ''').fetchone()
+
+# Records of the generators a run is for, the '*' day records for 'all'
+def run_generators(generator_names):
+    return ['*'] if generator_names == 'all' else generator_names
+
+# Dates that still need ingesting: any date in dates without an ok record for every generator
+# (or for the whole day with 'all'), plus earlier days with failed or invalid records for these
+# generators. Other generators' records are left for the runs that ingest them.
+def find_gaps(connection, dates, generator_names):
+    statuses = manifest_statuses(connection)
+    generators = set(run_generators(generator_names))
+
+    by_date = {}
+    for (date, generator), status in statuses.items():
+        if generator in generators:
+            by_date.setdefault(date, {})[generator] = status
+
+    gaps = set()
+
+    for date in dates:
+        day = by_date.get(date, {})
+
+        if not all(day.get(generator) == 'ok' for generator in generators):
+            gaps.add(date)
+
+    for date, day in by_date.items():
+        if any(status != 'ok' for status in day.values()):
+            gaps.add(date)
+
+    return sorted(gaps)
+
+# Mark ok files that changed or disappeared since they were ingested as invalid
+def verify_checksums(connection, dates):
+    records = []
+
+    for date, generator, checksum in connection.execute('''
+        select date, generator, checksum from generator_days where status = 'ok'
+    ''').fetchall():
+        if date not in dates:
+            continue
+
+        path = f'{storage_directory}/{date}_{generator}.csv'
+
+        if not os.path.exists(path) or file_checksum(path) != checksum:
+            records.append({'date': date, 'generator': generator, 'status': 'invalid', 'rows': None,
+                            'checksum': None, 'error': 'File changed or removed after ingestion'})
+
+    save_records(connection, records)
+
+    return records
+
+# Delete the files of the generators this run fetches again, those without an ok record on the
+# day. Other generators' files and the day's damlbmp_gen file are kept. With 'all' the day's
+# done marker goes too, so the day is split again.
+def forget_days(connection, dates, generator_names):
+    statuses = manifest_statuses(connection, set(dates))
+    index = load_zip_index()
+
+    for date in dates:
+        if generator_names == 'all':
+            generators = [generator for (day, generator), status in statuses.items()
+                          if day == date and generator != '*' and status != 'ok']
+            paths = [f'{storage_directory}/{date}_all.done']
+        else:
+            generators = [generator for generator in generator_names if statuses.get((date, generator)) != 'ok']
+            paths = []
+
+        paths += [f'{storage_directory}/{date}_{generator}.csv' for generator in generators]
+
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+        # Let the monthly archive be read again for these generators
+        month_index = index.get(date[0:6], {})
+        ingested = month_index.get(date)
+
+        if generator_names == 'all' or ingested == 'all':
+            # An 'all' entry can't leave out a few generators, the archive only writes missing files anyway
+            month_index.pop(date, None)
+        elif ingested is not None:
+            month_index[date] = sorted(set(ingested) - set(generators))
+
+    save_zip_index(index)
+
+def acquire_lock(path=None):
+    path = path or lock_path
+
+    try:
+        lock_file = open(path, 'a+')
+    except OSError:
+        return None
+
+    try:
+        import fcntl
+
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    except ImportError:
+        # No flock on Windows, fall back to an exclusive create of a second file
+        lock_file.close()
+
+        try:
+            os.close(os.open(path + '.held', os.O_CREAT | os.O_EXCL))
+        except FileExistsError:
+            return None
+
+        return path + '.held'
+
+    except OSError:
+        lock_file.close()
+        return None
+
+    return lock_file
+
+def release_lock(lock):
+    if isinstance(lock, str):
+        os.remove(lock)
+    else:
+        lock.close()
+
+def ingest(start_date=None, end_date=None, generator_names='all', base_url=nyiso_base_url, max_workers=8, verify=False):
+    if not os.path.exists(storage_directory):
+        os.makedirs(storage_directory)
+
+    if generator_names != 'all' and isinstance(generator_names, str):
+        generator_names = [generator_names]
+
+    lock = acquire_lock()
+
+    if lock is None:
+        print('Another ingestion run is in progress, exiting')
+        return None
+
+    try:
+        connection = connect()
+
+        # Pick up from the last completed run, its last day is checked again in case it was published late
+        if start_date is None:
+            last_run = last_completed_run(connection)
+
+            if last_run is None:
+                raise ValueError('No previous run to continue from, give a start date')
+
+            start_date = last_run[1]
+
+        end_date = end_date or datetime.today().strftime('%Y%m%d')
+        dates = [date.strftime('%Y%m%d') for date in pd.date_range(start_date, end_date)]
+
+        generators_label = 'all' if generator_names == 'all' else ','.join(generator_names)
+
+        with connection:
+            run_id = connection.execute('''
+                insert into runs (start_date, end_date, generators, started, status) values (?, ?, ?, ?, 'running')
+            ''', (start_date, end_date, generators_label, datetime.now().isoformat(timespec='seconds'))).lastrowid
+
+        try:
+            if verify:
+                verify_checksums(connection, set(dates))
+
+            failed_days = _ingest_gaps(connection, dates, generator_names, base_url, max_workers)
+        except Exception:
+            with connection:
+                connection.execute("update runs set finished = ?, status = 'error' where id = ?",
+                                   (datetime.now().isoformat(timespec='seconds'), run_id))
+            raise
+
+        with connection:
+            connection.execute('update runs set finished = ?, status = ?, failed_days = ? where id = ?',
+                               (datetime.now().isoformat(timespec='seconds'), 'ok' if len(failed_days) == 0 else 'incomplete',
+                                len(failed_days), run_id))
+
+        connection.close()
+
+        return failed_days
+
+    finally:
+        release_lock(lock)
+
+def _ingest_gaps(connection, dates, generator_names, base_url, max_workers):
+    gaps = find_gaps(connection, dates, generator_names)
+    print(f'Ingesting {len(gaps)} days, {len(set(gaps) & set(dates))} of the {len(dates)} days from {dates[0]} to {dates[-1]} '
+          f'and {len(set(gaps) - set(dates))} earlier failed days')
+
+    records = []
+
+    if len(gaps) > 0:
+        # Days with invalid files download the day's file again, a bad split would just repeat
+        statuses = manifest_statuses(connection, set(gaps))
+        generators = set(run_generators(generator_names))
+        refresh_dates = {date for (date, generator), status in statuses.items() if generator in generators and status == 'invalid'}
+
+        forget_days(connection, gaps, generator_names)
+
+        failed_dates = set(fetch_price_files(gaps, generator_names, base_url=base_url, max_workers=max_workers,
+                                             refresh_dates=refresh_dates))
+        save_generator_prices(gaps, generator_names)
+
+        for date in gaps:
+            if generator_names == 'all':
+                paths = glob.glob(f'{glob.escape(storage_directory)}/{date}_*.csv')
+                generators = [os.path.basename(path)[len(date) + 1:-len('.csv')] for path in paths]
+            else:
+                generators = generator_names
+
+            if len(generators) == 0:
+                error = 'Download failed' if date in failed_dates else 'No price data published for the day'
+                records.append({'date': date, 'generator': '*', 'status': 'failed', 'rows': None,
+                                'checksum': None, 'error': error})
+                continue
+
+            day_records = [validate_file(date, generator) for generator in generators]
+
+            for record in day_records:
+                if record['status'] == 'failed' and date in failed_dates:
+                    record['error'] = 'Download failed'
+
+            if generator_names == 'all':
+                bad = [record['generator'] for record in day_records if record['status'] != 'ok']
+
+                day_records.append({'date': date, 'generator': '*', 'status': 'ok' if len(bad) == 0 else 'invalid',
+                                    'rows': len(day_records), 'checksum': None,
+                                    'error': f'{len(bad)} generators not ok' if len(bad) > 0 else None})
+
+            records += day_records
+
+        save_records(connection, records)
+
+    failed_days = sorted({record['date'] for record in records if record['status'] != 'ok'})
+
+    for record in records:
+        if record['status'] != 'ok':
+            print(f"...{record['date']} {record['generator']}: {record['status']} ({record['error']})")
+
+    print(f'Ingested {len(gaps) - len(failed_days)} days, {len(failed_days)} failed or invalid')
+
+    return failed_days
+
+def print_status(connection):
+    print(f"{'status':>10} {'generator-days':>15} {'first':>10} {'last':>10}")
+
+    for status, count, first, last in connection.execute('''
+        select status, count(*), min(date), max(date) from generator_days group by status order by status
+    '''):
+        print(f'{status:>10} {count:>15} {first:>10} {last:>10}')
+
+    last_run = connection.execute('select start_date, end_date, started, status from runs order by id desc limit 1').fetchone()
+
+    if last_run is not None:
+        print(f'\nLast run: {last_run[0]} to {last_run[1]}, started {last_run[2]}, {last_run[3]}')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Incremental NYISO price ingestion')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    run_parser = subparsers.add_parser('run', help='fetch the missing, failed and invalid days')
+    run_parser.add_argument('--start', default=None, help='first date (YYYYMMDD), default: end of the last successful run')
+    run_parser.add_argument('--end', default=None, help='last date (YYYYMMDD), default: today')
+    run_parser.add_argument('--generators', nargs='+', default=['all'], help="generator names, default: 'all'")
+    run_parser.add_argument('--base-url', default=nyiso_base_url, help='price file server, e.g. a local stand-in')
+    run_parser.add_argument('--max-workers', type=int, default=8)
+    run_parser.add_argument('--verify', action='store_true', help='re-check the checksums of days already ingested')
+
+    subparsers.add_parser('status', help='summarize the manifest')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'status':
+        if not os.path.exists(manifest_path):
+            print('No manifest yet')
+            return 0
+
+        print_status(connect())
+        return 0
+
+    generator_names = 'all' if args.generators == ['all'] else args.generators
+    failed_days = ingest(args.start, args.end, generator_names, args.base_url, args.max_workers, args.verify)
+
+    # A run skipped because another one holds the lock is not an error
+    return 1 if failed_days else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
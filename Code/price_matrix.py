@@ -0,0 +1,286 @@
+import os
+import re
+import glob
+import json
+import shutil
+import argparse
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from web_scrape_price_data import storage_directory, market_timezone, parse_times
+
+# Memory-mapped price history of many generators. Each price column is one float32
+# (generators x hours) matrix in a raw binary file, with the generator names and the hours
+# stored next to it, so a reader maps the files and slices them without parsing anything.
+#
+#   Data/price_matrix/meta.json                   generator names, first hour (UTC), number of hours
+#   Data/price_matrix/times.npy                   local time of each hour, as in the CSV files
+#   Data/price_matrix/LB_MargPrice.f32            (generators x hours) float32
+#   Data/price_matrix/MargCostLosses.f32
+#   Data/price_matrix/MargCostCongestion.f32
+#
+# The hours run on a regular UTC grid, so the 23 and 25 hour DST days keep exactly the hours
+# of their files and the hours of a day are found by arithmetic. Hours without a file for a
+# generator are NaN. Build it once from the {date}_{generator}.csv files with
+#
+#   python price_matrix.py build
+#
+# and rebuild it after ingesting new days.
+
+matrix_directory = os.path.join(storage_directory, 'price_matrix')
+
+price_columns = ['LB_MargPrice', 'MargCostLosses', 'MargCostCongestion']
+
+hour = pd.Timedelta(hours=1)
+
+# Opened matrices by directory, reused until the matrix is rebuilt
+_open_matrices = {}
+
+def column_path(column, matrix_directory=matrix_directory):
+    return os.path.join(matrix_directory, f'{column}.f32')
+
+# UTC time of local midnight at the start of each date
+def day_starts(dates):
+    return pd.DatetimeIndex(pd.to_datetime(list(dates), format='%Y%m%d')).tz_localize(market_timezone).tz_convert('UTC')
+
+# The stored {date}_{generator}.csv files as {generator: [(date, path), ...]}
+def find_csv_files(storage_directory=storage_directory, generators=None, start_date=None, end_date=None):
+    file_pattern = re.compile(r'^(\d{8})_(.+)\.csv$')
+
+    files = {}
+    for path in glob.glob(os.path.join(storage_directory, '*.csv')):
+        match = file_pattern.match(os.path.basename(path))
+
+        if not match:
+            continue
+
+        date, generator = match.groups()
+
+        if generators is not None and generator not in generators:
+            continue
+        if (start_date is not None and date < start_date) or (end_date is not None and date > end_date):
+            continue
+
+        files.setdefault(generator, []).append((date, path))
+
+    return {generator: sorted(days) for generator, days in sorted(files.items())}
+
+# Hour of the grid of each row of a generator's files, -1 for times that don't exist
+def _hour_indices(times, start):
+    times = pd.DatetimeIndex(times)
+
+    # The repeated hour when clocks go back comes first in daylight saving time, then in standard time
+    utc_times = times.tz_localize(market_timezone, ambiguous=~times.duplicated(keep='first'), nonexistent='NaT')
+
+    indices = np.full(len(times), -1, dtype=np.int64)
+    valid = ~utc_times.isna()
+    indices[valid] = (utc_times[valid].tz_convert('UTC') - start) // hour
+
+    return indices
+
+def _fill_row(matrices, row, days, start, num_hours):
+    prices_df = pd.concat([pd.read_csv(path, usecols=['time'] + price_columns) for _, path in days], ignore_index=True)
+
+    indices = _hour_indices(parse_times(prices_df['time']), start)
+    keep = (indices >= 0) & (indices < num_hours)
+
+    for column in price_columns:
+        matrices[column][row, :] = np.nan
+        matrices[column][row, indices[keep]] = prices_df[column].values[keep]
+
+    return len(days)
+
+# Build the matrix from the stored {date}_{generator}.csv files, one generator (row) at a time
+# so only one generator's history is in memory. The new matrix replaces the old one once
+# complete, readers that still have the old one open keep reading it.
+def build_matrix(generators=None, start_date=None, end_date=None, storage_directory=storage_directory,
+                 matrix_directory=matrix_directory, max_workers=4):
+    files = find_csv_files(storage_directory, generators, start_date, end_date)
+
+    if len(files) == 0:
+        raise ValueError(f'No price files in {storage_directory} to build the matrix from')
+
+    dates = sorted({date for days in files.values() for date, _ in days})
+    first_date, last_date = dates[0], dates[-1]
+
+    start, end = day_starts([first_date, (pd.Timestamp(last_date) + pd.Timedelta(days=1)).strftime('%Y%m%d')])
+    num_hours = int((end - start) // hour)
+
+    generator_names = list(files)
+    shape = (len(generator_names), num_hours)
+
+    build_directory = matrix_directory + '.part'
+    if os.path.exists(build_directory):
+        shutil.rmtree(build_directory)
+    os.makedirs(build_directory)
+
+    matrices = {column: np.memmap(column_path(column, build_directory), dtype=np.float32, mode='w+', shape=shape)
+                for column in price_columns}
+
+    # Rows are independent, and reading the CSV files releases the GIL
+    with ThreadPoolExecutor(max_workers) as executor:
+        num_files = sum(executor.map(lambda row: _fill_row(matrices, row, files[generator_names[row]], start, num_hours),
+                                     range(len(generator_names))))
+
+    for matrix in matrices.values():
+        matrix.flush()
+    del matrices
+
+    times = pd.date_range(start, periods=num_hours, freq=hour).tz_convert(market_timezone).tz_localize(None)
+    np.save(os.path.join(build_directory, 'times.npy'), times.values)
+
+    meta = {
+        'generators': generator_names,
+        'start': start.isoformat(),
+        'num_hours': num_hours,
+        'first_date': first_date,
+        'last_date': last_date,
+        'columns': price_columns,
+        'dtype': 'float32',
+        'num_files': num_files,
+        'built': datetime.now().isoformat(timespec='seconds')
+    }
+
+    with open(os.path.join(build_directory, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=1)
+
+    if os.path.exists(matrix_directory):
+        shutil.rmtree(matrix_directory)
+    os.replace(build_directory, matrix_directory)
+
+    print(f'\n -- Built a {shape[0]} x {shape[1]} price matrix from {num_files} price files in {matrix_directory} -- \n')
+
+    return meta
+
+# Map the matrix for reading: {'generator_names', 'generator_index', 'start', 'times', column: memmap}
+def open_matrix(directory=None):
+    directory = directory or matrix_directory
+    meta_path = os.path.join(directory, 'meta.json')
+
+    if not os.path.exists(meta_path):
+        raise FileNotFoundError(f'No price matrix in {directory}, build one with: python price_matrix.py build')
+
+    key = (os.path.abspath(directory), os.stat(meta_path).st_mtime_ns)
+
+    if key not in _open_matrices:
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+
+        shape = (len(meta['generators']), meta['num_hours'])
+
+        matrix = {
+            'generator_names': meta['generators'],
+            'generator_index': {generator: row for row, generator in enumerate(meta['generators'])},
+            'start': pd.Timestamp(meta['start']),
+            'first_date': meta['first_date'],
+            'last_date': meta['last_date'],
+            'times': np.load(os.path.join(directory, 'times.npy'), mmap_mode='r')
+        }
+
+        for column in meta['columns']:
+            matrix[column] = np.memmap(column_path(column, directory), dtype=np.float32, mode='r', shape=shape)
+
+        # Drop an older build of the same directory
+        for old_key in [old_key for old_key in _open_matrices if old_key[0] == key[0]]:
+            del _open_matrices[old_key]
+
+        _open_matrices[key] = matrix
+
+    return _open_matrices[key]
+
+# Hours [first, last) of the dates from start_date to end_date (inclusive)
+def hour_range(matrix, start_date, end_date):
+    if start_date < matrix['first_date'] or end_date > matrix['last_date']:
+        raise ValueError(f"Dates {start_date} to {end_date} are outside the price matrix "
+                         f"({matrix['first_date']} to {matrix['last_date']})")
+
+    start, end = day_starts([start_date, (pd.Timestamp(end_date) + pd.Timedelta(days=1)).strftime('%Y%m%d')])
+
+    return int((start - matrix['start']) // hour), int((end - matrix['start']) // hour)
+
+# Row of one generator, or rows of several (a slice when they are stored next to each other)
+def generator_rows(matrix, generators):
+    missing = [generator for generator in ([generators] if isinstance(generators, str) else generators)
+               if generator not in matrix['generator_index']]
+
+    if len(missing) > 0:
+        raise ValueError(f'No price data for generators: {", ".join(missing)}')
+
+    if isinstance(generators, str):
+        return matrix['generator_index'][generators]
+
+    rows = [matrix['generator_index'][generator] for generator in generators]
+
+    if len(rows) > 0 and rows == list(range(rows[0], rows[0] + len(rows))):
+        return slice(rows[0], rows[0] + len(rows))
+
+    return rows
+
+# Prices of one generator (hours) or several (generators x hours) from start_date to end_date.
+# One generator, or generators stored next to each other, come back as a read-only view of the
+# mapped file, so nothing is read from disk until the values are used.
+def slice_prices(matrix, generators, start_date, end_date, column='LB_MargPrice'):
+    first, last = hour_range(matrix, start_date, end_date)
+
+    return matrix[column][generator_rows(matrix, generators), first:last]
+
+# Local times of the hours from start_date to end_date, a view like slice_prices
+def slice_times(matrix, start_date, end_date):
+    first, last = hour_range(matrix, start_date, end_date)
+
+    return matrix['times'][first:last]
+
+# Times and price columns for a list of 'YYYYMMDD' dates, shaped like slice_prices. Each run of
+# consecutive dates is one slice, so a contiguous date range is a view and only scattered dates
+# (e.g. sampled days) are copied.
+def read_prices(generators, date_range, directory=None):
+    matrix = open_matrix(directory)
+
+    dates = sorted(date_range)
+    day_numbers = pd.to_datetime(dates, format='%Y%m%d').values.astype('datetime64[D]').astype(np.int64)
+
+    # Split where the next date isn't the following day
+    runs = np.split(np.arange(len(dates)), np.flatnonzero(np.diff(day_numbers) != 1) + 1)
+    date_runs = [(dates[run[0]], dates[run[-1]]) for run in runs]
+
+    def gather(take):
+        parts = [take(start_date, end_date) for start_date, end_date in date_runs]
+
+        return parts[0] if len(parts) == 1 else np.concatenate(parts, axis=-1)
+
+    result = {'times': gather(lambda start_date, end_date: slice_times(matrix, start_date, end_date))}
+
+    for column in price_columns:
+        result[column] = gather(lambda start_date, end_date: slice_prices(matrix, generators, start_date, end_date, column))
+
+    return result
+
+def print_info(matrix_directory=matrix_directory):
+    matrix = open_matrix(matrix_directory)
+    shape = matrix['LB_MargPrice'].shape
+
+    size_mb = sum(os.path.getsize(column_path(column, matrix_directory)) for column in price_columns) / 1024**2
+
+    print(f"{shape[0]} generators x {shape[1]} hours, {matrix['first_date']} to {matrix['last_date']} ({size_mb:.1f} MB)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Memory-mapped generator price matrix')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build_parser = commands.add_parser('build', help='build the matrix from the stored price files')
+    build_parser.add_argument('--generators', nargs='+', default=None, help='default: every stored generator')
+    build_parser.add_argument('--start', default=None, help='first date (YYYYMMDD), default: earliest file')
+    build_parser.add_argument('--end', default=None, help='last date (YYYYMMDD), default: latest file')
+    build_parser.add_argument('--workers', type=int, default=4)
+
+    commands.add_parser('info', help='print the size and dates of the matrix')
+
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        build_matrix(args.generators, args.start, args.end, max_workers=args.workers)
+    else:
+        print_info()
@@ -0,0 +1,135 @@
+import os
+import re
+import sys
+import glob
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from web_scrape_price_data import storage_directory, parse_times
+
+# Columnar store of NYISO generator LBMP prices. One Parquet file per month holds every
+# generator, with a typed timestamp column, so a range query only opens the months it needs.
+#
+#   Data/price_store/202311.parquet
+#   Data/price_store/202312.parquet
+
+store_directory = os.path.join(storage_directory, 'price_store')
+
+price_columns = ['LB_MargPrice', 'MargCostLosses', 'MargCostCongestion']
+
+schema = pa.schema([
+    ('generator', pa.string()),
+    ('time', pa.timestamp('ns')),
+    ('LB_MargPrice', pa.float64()),
+    ('MargCostLosses', pa.float64()),
+    ('MargCostCongestion', pa.float64())
+])
+
+def month_path(month, store_directory=store_directory):
+    return os.path.join(store_directory, f'{month}.parquet')
+
+def _to_store_frame(price_df):
+    price_df = price_df[['generator', 'time'] + price_columns].copy()
+
+    if not pd.api.types.is_datetime64_any_dtype(price_df['time']):
+        price_df['time'] = parse_times(price_df['time'])
+
+    price_df[price_columns] = price_df[price_columns].astype('float64')
+
+    return price_df
+
+# Add prices for any generators and days to the store. A generator's day is replaced as a
+# whole by the new rows, times are local so the hour repeated when clocks go back appears twice
+# and can't be used to match rows.
+def write_prices(price_df, store_directory=store_directory):
+    if not os.path.exists(store_directory):
+        os.makedirs(store_directory)
+
+    price_df = _to_store_frame(price_df)
+
+    for month, month_df in price_df.groupby(price_df['time'].dt.strftime('%Y%m')):
+        path = month_path(month, store_directory)
+
+        if os.path.exists(path):
+            stored_df = pq.read_table(path).to_pandas()
+
+            rewritten = pd.MultiIndex.from_arrays([month_df['generator'], month_df['time'].dt.normalize()]).unique()
+            stored_days = pd.MultiIndex.from_arrays([stored_df['generator'], stored_df['time'].dt.normalize()])
+
+            month_df = pd.concat([stored_df[~stored_days.isin(rewritten)], month_df])
+
+        # Stable, so the repeated DST hour keeps its file order
+        month_df = month_df.sort_values(by=['generator', 'time'], kind='stable').reset_index(drop=True)
+
+        # Write to a temporary file first so a failed write can't corrupt the month
+        table = pa.Table.from_pandas(month_df, schema=schema, preserve_index=False)
+        pq.write_table(table, path + '.tmp')
+        os.replace(path + '.tmp', path)
+
+# Prices for one or more generators between two dates (inclusive, 'YYYYMMDD' or datetime)
+def read_prices(generators, start_date, end_date, store_directory=store_directory):
+    if isinstance(generators, str):
+        generators = [generators]
+
+    start = pd.Timestamp(start_date).normalize()
+    end = pd.Timestamp(end_date).normalize() + pd.Timedelta(days=1)
+
+    filters = [
+        ('generator', 'in', list(generators)),
+        ('time', '>=', start),
+        ('time', '<', end)
+    ]
+
+    tables = []
+    for month in pd.period_range(start, end - pd.Timedelta(days=1), freq='M'):
+        path = month_path(month.strftime('%Y%m'), store_directory)
+
+        if os.path.exists(path):
+            tables.append(pq.read_table(path, filters=filters))
+
+    if len(tables) == 0:
+        return pd.DataFrame({column: pd.Series(dtype=schema.field(column).type.to_pandas_dtype())
+                             for column in schema.names})
+
+    prices_df = pa.concat_tables(tables).to_pandas()
+
+    return prices_df.sort_values(by=['generator', 'time'], kind='stable').reset_index(drop=True)
+
+# Import the existing {date}_{generator}.csv files in Data/ into the store, a month at a time
+def import_csv_files(storage_directory=storage_directory, store_directory=store_directory):
+    file_pattern = re.compile(r'^(\d{8})_(.+)\.csv$')
+
+    files_by_month = {}
+    for path in glob.glob(os.path.join(storage_directory, '*.csv')):
+        match = file_pattern.match(os.path.basename(path))
+
+        if match:
+            date, generator = match.groups()
+            files_by_month.setdefault(date[0:6], []).append((path, generator))
+
+    num_files = 0
+    for month, files in sorted(files_by_month.items()):
+        dfs = []
+
+        for path, generator in files:
+            price_df = pd.read_csv(path)
+            price_df['generator'] = generator
+            dfs.append(price_df)
+
+        write_prices(pd.concat(dfs), store_directory)
+
+        num_files += len(files)
+        print(f'Imported {len(files)} files for month: {month}')
+
+    print(f'\n -- Imported {num_files} price files into {store_directory} -- \n')
+
+    return num_files
+
+
+if __name__ == '__main__':
+    # python price_store.py migrate
+    if len(sys.argv) == 2 and sys.argv[1] == 'migrate':
+        import_csv_files()
+    else:
+        print('Usage: python price_store.py migrate')
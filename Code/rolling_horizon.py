@@ -0,0 +1,100 @@
+import numpy as np
+
+from run_model import create_model
+from two_stage import update_daily_model
+from web_scrape_price_data import load_prices
+
+# Rolling horizon (model predictive control) backtest for a fixed fleet. Each window of
+# window_hours is solved, the first commit_hours are kept, the charge left at that point is
+# carried into the next window and the window slides forward by commit_hours. Only one model
+# per window length is ever built, so memory and solve time per window don't grow with the
+# length of the backtest.
+
+def run_rolling_horizon(parameters, prices_dict=None, window_hours=48, commit_hours=24, verbose=False):
+    battery_types_used = parameters['battery_types_used']
+    carry_over = parameters['carry_over']
+
+    if parameters['battery_counts'] is None:
+        raise ValueError('The rolling horizon needs a fixed fleet, set battery_counts first (e.g. from stage one)')
+
+    if commit_hours > window_hours:
+        raise ValueError('commit_hours can not be longer than window_hours')
+
+    # Without carry over the batteries are emptied at the start of each day, so windows have to start on a day
+    if not carry_over and commit_hours % 24 != 0:
+        raise ValueError('Without carry_over commit_hours has to be a whole number of days')
+
+    if prices_dict is None:
+        prices_dict = load_prices(parameters)
+
+    prices = np.asarray(prices_dict['prices'], dtype=float)
+    times = prices_dict['times']
+
+    if prices.ndim != 1:
+        raise ValueError('The rolling horizon handles a single price series, use run for several nodes')
+    num_periods = len(prices)
+
+    window_parameters = dict(parameters, formulation='state_of_charge', warehouses_used='set')
+
+    buy_ts = {battery_type: np.zeros(num_periods) for battery_type in battery_types_used}
+    sell_ts = {battery_type: np.zeros(num_periods) for battery_type in battery_types_used}
+    level_ts = {battery_type: np.zeros(num_periods) for battery_type in battery_types_used}
+
+    # Built once per window length (only the last window can be shorter) and reused after that
+    window_models = {}
+    initial_level = dict(parameters.get('initial_level') or {battery_type: 0 for battery_type in battery_types_used})
+    num_windows = 0
+
+    for start in range(0, num_periods, commit_hours):
+        end = min(start + window_hours, num_periods)
+        commit_end = min(start + commit_hours, num_periods)
+
+        window_prices = {'times': times[start:end], 'prices': prices[start:end]}
+
+        if end - start not in window_models:
+            window_parameters['initial_level'] = initial_level
+            window_models[end - start] = create_model(window_parameters, window_prices)
+
+            if not verbose:
+                window_models[end - start][0].setParam('OutputFlag', 0)
+
+        [model, decision_var_dict, constraint_params] = window_models[end - start]
+
+        update_daily_model(model, decision_var_dict, constraint_params, window_parameters, window_prices, initial_level)
+
+        model.optimize()
+        num_windows += 1
+
+        if model.SolCount == 0:
+            raise RuntimeError(f'No solution found for the window starting at period {start} (Gurobi status {model.status})')
+
+        # Keep the first commit_hours and carry the charge left after them into the next window
+        for battery_type in battery_types_used:
+            committed = range(commit_end - start)
+
+            buy_ts[battery_type][start:commit_end] = model.getAttr('X', [decision_var_dict[f'{battery_type}_buy'][p] for p in committed])
+            sell_ts[battery_type][start:commit_end] = model.getAttr('X', [decision_var_dict[f'{battery_type}_sell'][p] for p in committed])
+            level_ts[battery_type][start:commit_end] = model.getAttr('X', [decision_var_dict[f'{battery_type}_level'][p] for p in committed])
+
+            initial_level[battery_type] = level_ts[battery_type][commit_end - 1]
+
+    profit_ts = sum(prices * (sell_ts[battery_type] - buy_ts[battery_type]) for battery_type in battery_types_used)
+
+    # Same shape as the model_results and constraint_params that run returns
+    model_results = {
+        'num_periods': num_periods,
+        'buy_ts': buy_ts,
+        'sell_ts': sell_ts,
+        'level_ts': level_ts,
+        'profit_ts': profit_ts,
+        'time': list(range(num_periods)),
+        'total_profit': float(np.sum(profit_ts)),
+        'num_windows': num_windows
+    }
+
+    constraint_params = {
+        'price_times': times,
+        'prices': prices
+    }
+
+    return [model_results, constraint_params]
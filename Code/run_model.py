@@ -1,13 +1,151 @@
+import itertools
+import numpy as np
 import gurobipy as gp
 from gurobipy import GRB
-from webdriver_manager.chrome import ChromeDriverManager
 
-from web_scrape_price_data import download_price_data, extract_time_series_prices
+from web_scrape_price_data import load_prices
+from instrumentation import new_stats, stage, gurobi_stats, write_stats
 
 # OPTIGUIDE DATA CODE GOES HERE
 
 # Main function
-def create_model(parameters):
+# Number of generator nodes the fleet trades at: generator_name can be a list of nodes, which
+# gives a (nodes x periods) price matrix. One fleet and warehouse decision covers every node,
+# the charge level and the charge/discharge limits are shared and each node has its own buy
+# and sell variables.
+def num_nodes(parameters, prices):
+    nodes = len(prices) if np.ndim(prices) == 2 else 1
+
+    if parameters.get('num_markets', nodes) != nodes:
+        raise ValueError(f"num_markets is {parameters['num_markets']} but prices were given for {nodes} nodes")
+
+    return nodes
+
+# Warehouses that can be useful, grouped by area with the cheapest first: [(area, [index, ...]), ...].
+# Taking k warehouses of one area, the k cheapest are always best, so the model only needs to
+# choose how many of each area to take. Warehouses without area that cost something are never
+# worth taking and are dropped.
+def warehouse_groups(warehouse_data):
+    groups = {}
+
+    for i, warehouse in enumerate(warehouse_data):
+        if warehouse['area'] <= 0 and warehouse['cost'] >= 0:
+            continue
+
+        groups.setdefault(warehouse['area'], []).append(i)
+
+    return [(area, sorted(indices, key=lambda i: warehouse_data[i]['cost'])) for area, indices in groups.items()]
+
+# Stands in for the binary of one warehouse when warehouses are chosen by count per area: the
+# warehouse is used if it is among the cheapest `count` of its area. Read with .x like a Var.
+# The count is a Var, or a number once the model is solved and gone.
+class WarehouseChoice:
+    def __init__(self, group_count=None, rank=0):
+        self.group_count = group_count
+        self.rank = rank
+
+    @property
+    def x(self):
+        if self.group_count is None:
+            return 0
+
+        return int(round(getattr(self.group_count, 'X', self.group_count)) > self.rank)
+
+    X = x
+
+# Original warehouse index -> WarehouseChoice, for decision_var_dict['warehouses_used']
+def warehouse_choices(warehouse_data, groups, group_counts):
+    choices = gp.tupledict((i, WarehouseChoice()) for i in range(len(warehouse_data)))
+
+    for g, (area, indices) in enumerate(groups):
+        for rank, i in enumerate(indices):
+            choices[i] = WarehouseChoice(group_counts[g], rank)
+
+    return choices
+
+# Solved warehouses_used (0 or 1 per warehouse) in the same shape, for results that outlive the model
+def fixed_warehouse_choices(values):
+    return gp.tupledict((i, WarehouseChoice(int(round(value)))) for i, value in enumerate(values))
+
+# Warehouse variables when warehouses_used isn't given. By default one integer count per
+# distinct area replaces the binaries, so equal-area warehouses aren't branched on one by one.
+# Adds the area constraint for area_needed and returns the warehouse cost and
+# decision_var_dict['warehouses_used'].
+def add_warehouse_vars(model, parameters, area_needed):
+    warehouse_data = parameters['warehouse_data']
+
+    if not parameters.get('warehouse_reduction', True):
+        warehouses = model.addVars(len(warehouse_data), vtype=GRB.BINARY, name=f'Number of warehouses')
+
+        model.update()
+
+        model.addConstr(
+            gp.quicksum(warehouse_data[i]['area'] * warehouses[i] for i in range(len(warehouse_data))) >= area_needed,
+            name='Area_constraint'
+        )
+
+        return gp.quicksum(warehouse_data[i]['cost'] * warehouses[i] for i in range(len(warehouse_data))), warehouses
+
+    groups = warehouse_groups(warehouse_data)
+
+    group_counts = model.addVars(len(groups), vtype=GRB.INTEGER, name='Warehouses per area', lb=0,
+                                 ub=[len(indices) for _, indices in groups])
+
+    # Share of each warehouse taken, the cheapest of an area are filled first so the
+    # count alone decides which ones are used
+    picks = {i: model.addVar(vtype=GRB.CONTINUOUS, name=f'Warehouse {i}', lb=0, ub=1)
+             for _, indices in groups for i in indices}
+
+    model.update()
+
+    for g, (area, indices) in enumerate(groups):
+        model.addConstr(group_counts[g] == gp.quicksum(picks[i] for i in indices), name=f'Warehouse_count_{g}')
+
+    model.addConstr(
+        gp.quicksum(area * group_counts[g] for g, (area, _) in enumerate(groups)) >= area_needed,
+        name='Area_constraint'
+    )
+
+    warehouse_cost = gp.quicksum(warehouse_data[i]['cost'] * pick for i, pick in picks.items())
+
+    return warehouse_cost, warehouse_choices(warehouse_data, groups, group_counts)
+
+# add_warehouse_vars for the batched matrix models, area_needed is a matrix expression
+def add_warehouse_mvars(model, parameters, area_needed):
+    import scipy.sparse as sp
+
+    warehouse_data = parameters['warehouse_data']
+
+    if not parameters.get('warehouse_reduction', True):
+        areas = np.array([warehouse['area'] for warehouse in warehouse_data])
+        warehouse_costs = np.array([warehouse['cost'] for warehouse in warehouse_data])
+
+        warehouses = model.addMVar(len(warehouse_data), vtype=GRB.BINARY, name='Number of warehouses')
+
+        model.addConstr(areas @ warehouses - area_needed >= 0, name='Area_constraint')
+
+        return warehouse_costs @ warehouses, gp.tupledict(enumerate(warehouses.tolist()))
+
+    groups = warehouse_groups(warehouse_data)
+    picked = [i for _, indices in groups for i in indices]
+
+    group_areas = np.array([area for area, _ in groups])
+    pick_costs = np.array([warehouse_data[i]['cost'] for i in picked], dtype=float)
+
+    # Which group each pick belongs to
+    membership = sp.csr_matrix((np.ones(len(picked)), (np.repeat(np.arange(len(groups)), [len(indices) for _, indices in groups]),
+                                                       np.arange(len(picked)))), shape=(len(groups), len(picked)))
+
+    group_counts = model.addMVar(len(groups), vtype=GRB.INTEGER, name='Warehouses per area', lb=0,
+                                 ub=np.array([len(indices) for _, indices in groups]))
+    picks = model.addMVar(len(picked), vtype=GRB.CONTINUOUS, name='Warehouse', lb=0, ub=1)
+
+    model.addConstr(membership @ picks - group_counts == 0, name='Warehouse_count')
+    model.addConstr(group_areas @ group_counts - area_needed >= 0, name='Area_constraint')
+
+    return pick_costs @ picks, warehouse_choices(warehouse_data, groups, group_counts.tolist())
+
+def create_model(parameters, prices_dict=None):
     name = parameters['name']
     generator_name = parameters['generator_name']
     date_range = parameters['date_range']
@@ -18,21 +156,40 @@ def create_model(parameters):
     warehouses_used = parameters['warehouses_used']
     carry_over = parameters['carry_over']
 
+    # 'cumulative' rebuilds the charge level as a running sum of every earlier period,
+    # 'state_of_charge' keeps one level variable per period linked by a one-step balance
+    formulation = parameters.get('formulation', 'cumulative')
+
+    if formulation not in ('cumulative', 'state_of_charge'):
+        raise ValueError(f'Unknown formulation: {formulation}')
+
+    # Charge already held by each battery type at the start of the horizon
+    initial_level = parameters.get('initial_level') or {}
+
     # Container to fill with prices and dates to pass out of the function
     constraint_params = {}
 
-    download_price_data(date_range, generator_name)
+    if formulation == 'state_of_charge':
+        # First period balance of each battery type, its RHS is the initial level
+        constraint_params['initial_balance'] = {}
+
+    # Prices can be passed in directly (e.g. synthetic prices), otherwise download them. A time
+    # series of prices for Gurobi, a (nodes x periods) matrix for several generators.
+    if prices_dict is None:
+        prices_dict = load_prices(parameters, date_range)
 
-    # Extract time series of prices in a list for Gurobi
-    prices_dict = extract_time_series_prices(date_range, generator_name, aggregation=None)
     price_times = prices_dict['times']
 
-    prices = prices_dict['prices']
+    # Prices read from the price matrix are float32 views, Gurobi takes float64 coefficients
+    prices = np.asarray(prices_dict['prices'], dtype=float)
 
     # Create the model
     model = gp.Model(name)
 
-    num_periods = len(prices)
+    # A list of generators gives (nodes x periods) prices, even for a single generator
+    nodes = num_nodes(parameters, prices)
+
+    num_periods = np.shape(prices)[-1]
     parameters['num_periods'] = num_periods
 
     periods = range(num_periods)
@@ -46,7 +203,11 @@ def create_model(parameters):
     # Create the main decision vars - amount to buy and sell for each period
     for battery_type in battery_types_used:
         for key in [f'{battery_type}_buy', f'{battery_type}_sell']:
-            decision_var_dict[key] = model.addVars(num_periods, vtype=GRB.CONTINUOUS, name=key, lb=0)
+            if prices.ndim == 1:
+                decision_var_dict[key] = model.addVars(num_periods, vtype=GRB.CONTINUOUS, name=key, lb=0)
+            else:
+                # Indexed (node, period)
+                decision_var_dict[key] = model.addVars(nodes, num_periods, vtype=GRB.CONTINUOUS, name=key, lb=0)
 
     objs = []
     total_area_needed = 0
@@ -64,6 +225,14 @@ def create_model(parameters):
         max_discharge = battery['max_discharge']
         size = battery['size']
         cost = battery['cost']
+        start_level = initial_level.get(battery_type, 0)
+
+        # Energy bought and sold in each period, summed over the nodes
+        if prices.ndim == 1:
+            total_buy, total_sell = buy, sell
+        else:
+            total_buy = {p: buy.sum('*', p) for p in periods}
+            total_sell = {p: sell.sum('*', p) for p in periods}
 
         # Create decison vars for the batteries if they weren't passed in
         if battery_counts is None:
@@ -74,40 +243,47 @@ def create_model(parameters):
         else:
             battery_count = battery_counts[battery_type]
 
+        if formulation == 'state_of_charge':
+            level = model.addVars(num_periods, vtype=GRB.CONTINUOUS, name=f'{battery_type}_level', lb=0)
+            decision_var_dict[f'{battery_type}_level'] = level
+
         # Main contraints
         for p in range(num_periods):
-            current_level = gp.quicksum(charge_loss * buy[p_] - sell[p_] for p_ in range(p + 1))
+            if formulation == 'state_of_charge':
+                # Charge at the end of the period is last period's charge plus this period's flow
+                previous_level = level[p - 1] if p > 0 else start_level
+                balance = model.addConstr(level[p] == previous_level + charge_loss * total_buy[p] - total_sell[p], f'BalanceConstraint_period_{p+1}')
+
+                if p == 0:
+                    constraint_params['initial_balance'][battery_type] = balance
+
+                current_level = level[p]
+            else:
+                current_level = start_level + gp.quicksum(charge_loss * total_buy[p_] - total_sell[p_] for p_ in range(p + 1))
 
             if not carry_over and p % 24 == 0:
                 model.addConstr(current_level <= 0, 'CarryOverConstraint')
 
             model.addConstr(current_level <= capacity * battery_count, f'CapacityConstraint_period_{p+1}') # Can't have more charge than max capacity
             model.addConstr(current_level >= 0, f'SupplyConstraint_period_{p+1}') # Can't have a negative amount of charge
-            model.addConstr(buy[p] * charge_loss <= max_charge * battery_count, f'ChargeConstraint_period_{p+1}') # Can't charge more then the batteries can charge in one period
-            model.addConstr(sell[p] <= max_discharge * battery_count, f'DischargeConstraint_period_{p+1}') # Can't discharge more then the batteries can charge in one period
+            model.addConstr(total_buy[p] * charge_loss <= max_charge * battery_count, f'ChargeConstraint_period_{p+1}') # Can't charge more then the batteries can charge in one period
+            model.addConstr(total_sell[p] <= max_discharge * battery_count, f'DischargeConstraint_period_{p+1}') # Can't discharge more then the batteries can charge in one period
 
         model.update()
 
         # Objective value summation
-        objs = objs + [prices[p] * sell[p] - prices[p] * buy[p] for p in periods]
+        if prices.ndim == 1:
+            objs = objs + [prices[p] * sell[p] - prices[p] * buy[p] for p in periods]
+        else:
+            node_prices = {(n, p): prices[n][p] for n in range(nodes) for p in periods}
+            objs = objs + [sell.prod(node_prices) - buy.prod(node_prices)]
 
         total_area_needed += battery_count * size
 
     # Create decision vars for warehouses if not passed in
     if warehouses_used is None:
-        warehouses_used = model.addVars(len(warehouse_data), vtype=GRB.BINARY, name=f'Number of warehouses')
-        decision_var_dict['warehouses_used'] = warehouses_used
-
-        model.update()
-
-        model.addConstr(
-            gp.quicksum(
-                warehouse_data[i]['area'] * warehouses_used[i] for i, warehouse in enumerate(warehouse_data)
-            ) >= total_area_needed,
-            name='Area_constraint'
-        )
-
-        objs = objs + [warehouse_data[i]['cost'] * warehouses_used[i] * -1 for i, warehouse in enumerate(warehouse_data)]
+        warehouse_cost, decision_var_dict['warehouses_used'] = add_warehouse_vars(model, parameters, total_area_needed)
+        objs.append(-warehouse_cost)
 
     model.update()
 
@@ -121,58 +297,250 @@ def create_model(parameters):
     constraint_params['price_times'] = price_times
     constraint_params['prices'] = prices_dict['prices']
 
+    if 'generator_names' in prices_dict:
+        constraint_params['generator_names'] = prices_dict['generator_names']
+
+    return [model, decision_var_dict, constraint_params]
+
+
+# Same model as create_model with the 'state_of_charge' formulation, but every block of
+# constraints is added in one matrix call instead of one call per period
+def create_matrix_model(parameters, prices_dict=None):
+    import scipy.sparse as sp
+
+    name = parameters['name']
+    generator_name = parameters['generator_name']
+    date_range = parameters['date_range']
+    battery_types = parameters['battery_types']
+    battery_types_used = parameters['battery_types_used']
+    battery_counts = parameters['battery_counts']
+    warehouse_data = parameters['warehouse_data']
+    warehouses_used = parameters['warehouses_used']
+    carry_over = parameters['carry_over']
+    initial_level = parameters.get('initial_level') or {}
+
+    constraint_params = {}
+
+    if prices_dict is None:
+        prices_dict = load_prices(parameters, date_range)
+
+    price_times = prices_dict['times']
+    prices = np.asarray(prices_dict['prices'], dtype=float)
+
+    model = gp.Model(name)
+
+    nodes = num_nodes(parameters, prices)
+
+    num_periods = prices.shape[-1]
+    parameters['num_periods'] = num_periods
+
+    decision_var_dict = {}
+
+    # Sums the node-major (node, period) buy and sell vectors over the nodes
+    node_sum = sp.hstack([sp.eye(num_periods, format='csr')] * nodes, format='csr')
+    var_keys = list(range(num_periods)) if prices.ndim == 1 else list(itertools.product(range(nodes), range(num_periods)))
+
+    # Level in each period minus the level in the period before it
+    difference = sp.eye(num_periods, format='csr') - sp.eye(num_periods, k=-1, format='csr')
+
+    # Spreads a single battery count over every period
+    ones = np.ones((num_periods, 1))
+
+    # Without carry over the batteries are empty after the first hour of each day
+    level_ub = np.full(num_periods, GRB.INFINITY)
+    if not carry_over:
+        level_ub[::24] = 0
+
+    sizes = np.array([battery_types[battery_type]['size'] for battery_type in battery_types_used])
+    costs = np.array([battery_types[battery_type]['cost'] for battery_type in battery_types_used])
+
+    # Create decison vars for the batteries if they weren't passed in
+    if battery_counts is None:
+        counts = model.addMVar(len(battery_types_used), vtype=GRB.INTEGER, name='battery_counts', lb=0)
+        decision_var_dict['battery_counts'] = dict(zip(battery_types_used, counts.tolist()))
+
+        objective = -costs @ counts
+        total_area_needed = sizes @ counts
+    else:
+        counts = np.array([battery_counts[battery_type] for battery_type in battery_types_used], dtype=float)
+
+        objective = 0
+        total_area_needed = float(sizes @ counts)
+
+    for i, battery_type in enumerate(battery_types_used):
+        battery = battery_types[battery_type]
+
+        capacity = battery['capacity']
+        charge_loss = battery['charge_loss']
+        max_charge = battery['max_charge']
+        max_discharge = battery['max_discharge']
+
+        buy = model.addMVar(nodes * num_periods, vtype=GRB.CONTINUOUS, name=f'{battery_type}_buy', lb=0)
+        sell = model.addMVar(nodes * num_periods, vtype=GRB.CONTINUOUS, name=f'{battery_type}_sell', lb=0)
+        level = model.addMVar(num_periods, vtype=GRB.CONTINUOUS, name=f'{battery_type}_level', lb=0, ub=level_ub)
+
+        # Same tupledict shape as addVars so run and the plots can index by period (or node and period)
+        decision_var_dict[f'{battery_type}_buy'] = gp.tupledict(zip(var_keys, buy.tolist()))
+        decision_var_dict[f'{battery_type}_sell'] = gp.tupledict(zip(var_keys, sell.tolist()))
+        decision_var_dict[f'{battery_type}_level'] = gp.tupledict(enumerate(level.tolist()))
+
+        total_buy = buy if nodes == 1 else node_sum @ buy
+        total_sell = sell if nodes == 1 else node_sum @ sell
+
+        if battery_counts is None:
+            battery_count = ones @ counts[i:i + 1]
+        else:
+            battery_count = np.full(num_periods, counts[i])
+
+        start_level = np.zeros(num_periods)
+        start_level[0] = initial_level.get(battery_type, 0)
+
+        model.addConstr(difference @ level - charge_loss * total_buy + total_sell == start_level, name=f'{battery_type}_BalanceConstraint')
+        model.addConstr(level - capacity * battery_count <= 0, name=f'{battery_type}_CapacityConstraint')
+        model.addConstr(charge_loss * total_buy - max_charge * battery_count <= 0, name=f'{battery_type}_ChargeConstraint')
+        model.addConstr(total_sell - max_discharge * battery_count <= 0, name=f'{battery_type}_DischargeConstraint')
+
+        objective = objective + prices.ravel() @ sell - prices.ravel() @ buy
+
+    # Create decision vars for warehouses if not passed in, one integer count per distinct area
+    # by default (see create_model)
+    if warehouses_used is None:
+        warehouse_cost, decision_var_dict['warehouses_used'] = add_warehouse_mvars(model, parameters, total_area_needed)
+        objective = objective - warehouse_cost
+
+    model.setObjective(objective, GRB.MAXIMIZE)
+
+    model.update()
+
+    constraint_params['price_times'] = price_times
+    constraint_params['prices'] = prices_dict['prices']
+
+    if 'generator_names' in prices_dict:
+        constraint_params['generator_names'] = prices_dict['generator_names']
+
     return [model, decision_var_dict, constraint_params]
 
 
 # Run the model
-def run(parameters, print_results=False):
+def run(parameters, print_results=False, prices_dict=None):
     battery_types_used = parameters['battery_types_used']
 
-    # Create model
-    [model, decision_var_dict, constraint_params] = create_model(parameters)
+    # Time and memory of each stage, returned in model_results['stats']
+    stats = new_stats()
+    trace_memory = parameters.get('trace_memory', False)
 
-    # Run model
-    model.optimize()
+    if prices_dict is None:
+        prices_dict = load_prices(parameters, stats=stats)
 
-    if model.status == GRB.OPTIMAL:
-        # Unpack results
-        model_results = {}
+    # Create model, 'matrix' builds the constraints in batched matrix calls
+    with stage(stats, 'build', trace_memory):
+        if parameters.get('builder', 'loop') == 'matrix':
+            [model, decision_var_dict, constraint_params] = create_matrix_model(parameters, prices_dict)
+        else:
+            [model, decision_var_dict, constraint_params] = create_model(parameters, prices_dict)
+
+    # Run model
+    with stage(stats, 'solve', trace_memory):
+        model.optimize()
 
-        model_results['num_periods'] = parameters['num_periods']
-        model_results['buy_ts'] = {battery_type: [] for battery_type in battery_types_used}
-        model_results['sell_ts'] = {battery_type: [] for battery_type in battery_types_used}
-        model_results['time'] = list(range(parameters['num_periods']))
-        model_results['total_profit'] = model.objVal
+    stats['gurobi'] = gurobi_stats(model)
 
-        if print_results:
-            print("\nOptimal Solution:")
+    if model.status == GRB.OPTIMAL:
+        # Unpack results, one bulk attribute query per variable block
+        with stage(stats, 'extract', trace_memory):
+            model_results = {}
 
-        for p in range(model_results['num_periods']):
-            if print_results:
-                print(f"\nPeriod {p + 1}:")
+            model_results['num_periods'] = parameters['num_periods']
+            model_results['buy_ts'] = {}
+            model_results['sell_ts'] = {}
+            model_results['time'] = list(range(parameters['num_periods']))
+            model_results['total_profit'] = model.objVal
 
             for battery_type in battery_types_used:
-                buy = decision_var_dict[f'{battery_type}_buy']
-                sell = decision_var_dict[f'{battery_type}_sell']
+                for action in ['buy', 'sell', 'level']:
+                    variables = decision_var_dict.get(f'{battery_type}_{action}')
+
+                    if variables is not None:
+                        values = np.array(model.getAttr('X', list(variables.values())))
 
-                if print_results:
-                    print(f"\nFor Battery Type: {battery_type}:")
+                        # One row per node when trading at several nodes
+                        if action != 'level':
+                            values = values.reshape(np.shape(constraint_params['prices']))
 
-                if print_results:
-                    print(f"Buy {buy[p].x}")
-                    print(f"Sell {sell[p].x}")
+                        model_results.setdefault(f'{action}_ts', {})[battery_type] = values
 
-                model_results['buy_ts'][battery_type].append(buy[p].x)
-                model_results['sell_ts'][battery_type].append(sell[p].x)
+        model_results['stats'] = stats
 
         if print_results:
-            print(f"\nTotal Profit: {model.objVal}")
+            print_summary(model_results, constraint_params)
 
     else:
         model_results = None
         print("No solution found")
 
     if parameters['battery_counts'] is None:
-        decision_var_dict['battery_counts'] = {key: battery_count.x for key, battery_count in decision_var_dict['battery_counts'].items()}
+        battery_counts = decision_var_dict['battery_counts']
+        decision_var_dict['battery_counts'] = dict(zip(battery_counts.keys(), model.getAttr('X', list(battery_counts.values()))))
+
+    # Optionally append the stats as one JSON line, failed solves included
+    if parameters.get('stats_path'):
+        write_stats(stats, parameters['stats_path'], parameters)
+
+    return [model, decision_var_dict, model_results, constraint_params]
+
+# Tidy frame of the results with one row per period and battery type (and node, when trading
+# at several nodes)
+def results_to_frame(model_results, constraint_params):
+    import pandas as pd
+
+    times = constraint_params['price_times']
+    prices = np.asarray(constraint_params['prices'], dtype=float)
+    node_names = constraint_params.get('generator_names')
+
+    frames = []
+    for battery_type, buy in model_results['buy_ts'].items():
+        sell = model_results['sell_ts'][battery_type]
+
+        if prices.ndim == 1:
+            node_prices, node_buys, node_sells = [prices], [buy], [sell]
+        else:
+            node_prices, node_buys, node_sells = prices, buy, sell
+
+        for n, (node_price, node_buy, node_sell) in enumerate(zip(node_prices, node_buys, node_sells)):
+            frame = pd.DataFrame({
+                'time': times,
+                'battery_type': battery_type,
+                'price': node_price,
+                'buy': node_buy,
+                'sell': node_sell,
+                'profit': node_price * (node_sell - node_buy)
+            })
+
+            if prices.ndim == 2:
+                frame.insert(1, 'node', node_names[n] if node_names is not None else n)
+
+            # The charge level is shared by the nodes
+            if 'level_ts' in model_results:
+                frame['level'] = model_results['level_ts'][battery_type]
+
+            frames.append(frame)
+
+    index = ['time', 'battery_type'] if prices.ndim == 1 else ['time', 'node', 'battery_type']
+
+    return pd.concat(frames, ignore_index=True).set_index(index)
+
+# Short report of the solution instead of printing every period
+def print_summary(model_results, constraint_params):
+    prices = np.asarray(constraint_params['prices'], dtype=float)
+
+    print(f"\nOptimal Solution over {model_results['num_periods']} periods:")
+    print(f"{'battery':>12} {'bought':>12} {'sold':>12} {'active hours':>13} {'revenue':>14}")
+
+    for battery_type, buy in model_results['buy_ts'].items():
+        sell = model_results['sell_ts'][battery_type]
+        active_hours = int(np.sum(np.atleast_2d((buy > 1e-9) | (sell > 1e-9)).any(axis=0)))
+        revenue = float(np.sum(prices * (sell - buy)))
+
+        print(f"{battery_type:>12} {buy.sum():>12.2f} {sell.sum():>12.2f} {active_hours:>13} {revenue:>14.2f}")
 
-    return [model, decision_var_dict, model_results, constraint_params]
\ No newline at end of file
+    print(f"\nTotal Profit: {model_results['total_profit']}")
@@ -0,0 +1,92 @@
+import copy
+import traceback
+import gurobipy as gp
+from concurrent.futures import ProcessPoolExecutor
+
+from run_model import run
+from web_scrape_price_data import download_price_data
+
+# Run many independent scenarios (parameter sweeps, date windows) across a process pool.
+# Gurobi models can't be pickled, so each worker sends back plain results instead.
+
+def _init_worker(threads_per_worker):
+    # Every model built in this process picks up the default environment's thread cap
+    gp.setParam('Threads', threads_per_worker)
+
+def _run_scenario(parameters, print_results):
+    try:
+        [model, decision_var_dict, model_results, _] = run(parameters, print_results=print_results)
+
+        if model_results is None:
+            return {'status': 'failed', 'error': f'No solution found (Gurobi status {model.status})'}
+
+        result = {
+            'status': 'ok',
+            'objective': model.objVal,
+            'model_results': model_results,
+            'battery_counts': dict(parameters['battery_counts'] or decision_var_dict['battery_counts'])
+        }
+
+        if 'warehouses_used' in decision_var_dict:
+            result['warehouses_used'] = {i: var.x for i, var in decision_var_dict['warehouses_used'].items()}
+
+        return result
+
+    except Exception:
+        return {'status': 'failed', 'error': traceback.format_exc()}
+
+# Turn a scenario into a full parameters dict. Scenarios are either parameters dicts
+# (merged over base_parameters if given) or date windows (lists of 'YYYYMMDD' dates)
+def _scenario_parameters(scenario, base_parameters):
+    if isinstance(scenario, dict):
+        parameters = copy.deepcopy(base_parameters) if base_parameters is not None else {}
+        parameters.update(copy.deepcopy(scenario))
+    else:
+        if base_parameters is None:
+            raise ValueError('base_parameters are needed to run date window scenarios')
+
+        parameters = copy.deepcopy(base_parameters)
+        parameters['date_range'] = list(scenario)
+
+    return parameters
+
+def daily_windows(date_range):
+    return [[date] for date in date_range]
+
+def run_scenarios(scenarios, base_parameters=None, max_workers=None, threads_per_worker=1,
+                  download_first=True, print_results=False):
+    all_parameters = [_scenario_parameters(scenario, base_parameters) for scenario in scenarios]
+
+    # Download every price file up front, workers scraping the same directory at once would clash
+    if download_first:
+        dates_by_generator = {}
+
+        for parameters in all_parameters:
+            generator_names = parameters['generator_name']
+
+            # Scenarios trading at several nodes download each of them
+            for generator_name in [generator_names] if isinstance(generator_names, str) else generator_names:
+                dates = dates_by_generator.setdefault(generator_name, [])
+                dates += [date for date in parameters['date_range'] if date not in dates]
+
+        for generator_name, dates in dates_by_generator.items():
+            download_price_data(dates, generator_name)
+
+    results = []
+
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                             initargs=(threads_per_worker,)) as executor:
+        futures = [executor.submit(_run_scenario, parameters, print_results) for parameters in all_parameters]
+
+        # Collect in input order, a crashed worker only fails its own scenario
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception:
+                results.append({'status': 'failed', 'error': traceback.format_exc()})
+
+    num_failed = sum(result['status'] == 'failed' for result in results)
+    if num_failed:
+        print(f'{num_failed} of {len(results)} scenarios failed')
+
+    return results
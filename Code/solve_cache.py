@@ -0,0 +1,154 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from web_scrape_price_data import storage_directory, load_prices
+
+# Content addressed cache around run_model.run. The key is a hash of the prices and of every
+# parameter that changes the model, so the same date window with the same parameters is
+# answered from disk instead of being rebuilt and re-solved. Each entry is one .npz file, and
+# the least recently used entries are removed once the cache is larger than max_bytes.
+
+cache_directory = os.path.join(storage_directory, 'solve_cache')
+
+# Bump when the model changes so old entries are no longer used
+cache_version = 2
+
+# Parameters that change the model or its solution (generator_name and date_range only matter
+# through the prices)
+key_parameters = ['battery_types_used', 'battery_counts', 'warehouse_data', 'warehouses_used', 'carry_over',
+                  'formulation', 'builder', 'initial_level', 'solver', 'num_markets', 'warehouse_reduction']
+
+cache_stats = {'hits': 0, 'misses': 0}
+
+def cache_key(parameters, prices):
+    key_data = {name: parameters.get(name) for name in key_parameters}
+    key_data['battery_types'] = {battery_type: parameters['battery_types'][battery_type]
+                                 for battery_type in parameters['battery_types_used']}
+    key_data['version'] = cache_version
+
+    # The same values as (nodes x periods) or as one longer series are different models
+    key_data['prices_shape'] = list(np.shape(prices))
+
+    digest = hashlib.sha256()
+    digest.update(np.ascontiguousarray(prices, dtype=np.float64).tobytes())
+    digest.update(json.dumps(key_data, sort_keys=True, default=float).encode())
+
+    return digest.hexdigest()
+
+def _entry_path(key, cache_directory):
+    return os.path.join(cache_directory, f'{key}.npz')
+
+def _save_entry(path, model_results, solution):
+    arrays = {}
+    for action in ['buy_ts', 'sell_ts', 'level_ts']:
+        for battery_type, values in model_results.get(action, {}).items():
+            arrays[f'{action}__{battery_type}'] = values
+
+    arrays['solution'] = np.array(json.dumps(solution, default=float))
+
+    # Write to a temporary file first so a half written entry is never read
+    with open(path + '.part', 'wb') as entry_file:
+        np.savez(entry_file, **arrays)
+
+    os.replace(path + '.part', path)
+
+def _load_entry(path):
+    with np.load(path) as entry:
+        solution = json.loads(str(entry['solution']))
+
+        model_results = {
+            'num_periods': solution['num_periods'],
+            'time': list(range(solution['num_periods'])),
+            'total_profit': solution['objective']
+        }
+
+        for name in entry.files:
+            if '__' in name:
+                action, battery_type = name.split('__', 1)
+                model_results.setdefault(action, {})[battery_type] = entry[name]
+
+    return model_results, solution
+
+# Remove the least recently used entries until the cache fits in max_bytes
+def evict(cache_directory=cache_directory, max_bytes=500 * 1024**2):
+    entries = [os.path.join(cache_directory, name) for name in os.listdir(cache_directory) if name.endswith('.npz')]
+    entries = sorted(entries, key=os.path.getmtime)
+
+    total_bytes = sum(os.path.getsize(path) for path in entries)
+
+    while total_bytes > max_bytes and len(entries) > 0:
+        path = entries.pop(0)
+        total_bytes -= os.path.getsize(path)
+        os.remove(path)
+
+# Same inputs as run. Returns model_results, a solution dict (objective, battery_counts,
+# warehouses_used) and constraint_params. The Gurobi model isn't kept, so a cache hit
+# needs no solver at all. With parameters['solver'] = 'dp' a miss is solved with
+# dp_dispatch.solve_dispatch (for a fixed fleet) instead of Gurobi.
+def cached_run(parameters, prices_dict=None, cache_directory=cache_directory, max_bytes=500 * 1024**2):
+    if prices_dict is None:
+        prices_dict = load_prices(parameters)
+
+    constraint_params = {
+        'price_times': prices_dict['times'],
+        'prices': prices_dict['prices']
+    }
+
+    key = cache_key(parameters, prices_dict['prices'])
+    path = _entry_path(key, cache_directory)
+
+    if os.path.exists(path):
+        cache_stats['hits'] += 1
+        print(f"Solve cache hit: {key[:12]} ({cache_stats['hits']} hits, {cache_stats['misses']} misses)")
+
+        # Touch the entry so it counts as recently used
+        os.utime(path)
+
+        model_results, solution = _load_entry(path)
+        parameters['num_periods'] = model_results['num_periods']
+
+        return [model_results, solution, constraint_params]
+
+    cache_stats['misses'] += 1
+    print(f"Solve cache miss: {key[:12]} ({cache_stats['hits']} hits, {cache_stats['misses']} misses)")
+
+    if parameters.get('solver') == 'dp':
+        from dp_dispatch import solve_dispatch
+
+        [model_results, constraint_params] = solve_dispatch(parameters, prices_dict)
+
+        solution = {
+            'objective': model_results['total_profit'],
+            'num_periods': model_results['num_periods'],
+            'battery_counts': dict(parameters['battery_counts']),
+            'warehouses_used': parameters['warehouses_used'] if isinstance(parameters['warehouses_used'], list) else None
+        }
+    else:
+        # Only a miss needs Gurobi
+        from run_model import run
+
+        [model, decision_var_dict, model_results, constraint_params] = run(parameters, prices_dict=prices_dict)
+
+        # Nothing to cache if the model wasn't solved
+        if model_results is None:
+            return [None, None, constraint_params]
+
+        solution = {
+            'objective': model.objVal,
+            'num_periods': model_results['num_periods'],
+            'battery_counts': dict(decision_var_dict.get('battery_counts') or parameters['battery_counts']),
+            'warehouses_used': None
+        }
+
+        if 'warehouses_used' in decision_var_dict:
+            solution['warehouses_used'] = [var.x for var in decision_var_dict['warehouses_used'].values()]
+
+    if not os.path.exists(cache_directory):
+        os.makedirs(cache_directory)
+
+    _save_entry(path, model_results, solution)
+    evict(cache_directory, max_bytes)
+
+    return [model_results, solution, constraint_params]
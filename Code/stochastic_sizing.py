@@ -0,0 +1,340 @@
+import numpy as np
+import pandas as pd
+import gurobipy as gp
+from gurobipy import GRB
+from datetime import timedelta
+
+from run_model import create_model, add_warehouse_vars, add_warehouse_mvars, fixed_warehouse_choices
+from two_stage import update_daily_model
+from web_scrape_price_data import load_prices
+
+# Stage one sizing over many sampled price scenarios instead of the single preceding month.
+# Scenarios are built from the stored price history, either by bootstrapping days (each
+# scenario is scenario_days days drawn with replacement) or by sampling months (each scenario
+# is a run of scenario_days consecutive days starting at a random day of the history). DST days
+# are brought to 24 hours so they stay in the history and the runs of days stay consecutive.
+#
+# The battery counts and warehouses are shared by all scenarios and each scenario has its own
+# dispatch, maximizing the expected profit. mode='extensive' builds the whole two-stage MILP at
+# once, which grows with the number of scenarios. mode='decomposition' solves it with Benders
+# cuts instead: a small master problem picks the fleet and warehouses, and one dispatch LP built
+# by create_model is re-solved for every scenario with only the prices swapped in. The reduced
+# costs of the (fixed) battery counts give the marginal profit of one more battery, which is
+# the cut added to the master. Memory then doesn't grow with the number of scenarios.
+
+# Dates of the history_days days before start_date
+def history_dates(start_date, history_days=365):
+    return [(start_date - timedelta(days=i)).strftime('%Y%m%d') for i in range(history_days, 0, -1)]
+
+# (days x 24) matrix of the days in a price series, by local hour of the day. On the 25 hour DST
+# day the repeated hour is averaged and on the 23 hour day the skipped hour repeats the hour
+# before it. Days missing any other hour (e.g. partly downloaded) are left out.
+def daily_price_matrix(prices_dict):
+    times = pd.DatetimeIndex(prices_dict['times'])
+    prices = np.asarray(prices_dict['prices'], dtype=float)
+
+    days, day_index = np.unique(times.normalize(), return_inverse=True)
+    hours = times.hour
+
+    sums = np.zeros((len(days), 24))
+    counts = np.zeros((len(days), 24))
+    np.add.at(sums, (day_index, hours), prices)
+    np.add.at(counts, (day_index, hours), 1)
+
+    daily_prices = sums / np.maximum(counts, 1)
+
+    # The hour the clocks skip in spring
+    skipped = (counts[:, 2] == 0) & (counts[:, 1] > 0)
+    daily_prices[skipped, 2] = daily_prices[skipped, 1]
+    counts[skipped, 2] = 1
+
+    return daily_prices[(counts > 0).all(axis=1)]
+
+# (num_scenarios x scenario_days * 24) matrix of sampled price paths
+def sample_scenarios(daily_prices, num_scenarios, scenario_days=30, method='days', seed=0):
+    rng = np.random.default_rng(seed)
+    num_history_days = len(daily_prices)
+
+    if method == 'days':
+        picks = rng.integers(0, num_history_days, size=(num_scenarios, scenario_days))
+    elif method == 'months':
+        if num_history_days < scenario_days:
+            raise ValueError(f'Only {num_history_days} days of history, {scenario_days} needed to sample months')
+
+        starts = rng.integers(0, num_history_days - scenario_days + 1, size=num_scenarios)
+        picks = starts[:, None] + np.arange(scenario_days)
+    else:
+        raise ValueError(f'Unknown sampling method: {method}')
+
+    return daily_prices[picks].reshape(num_scenarios, scenario_days * 24)
+
+# Two-stage stochastic MILP with every scenario's dispatch in one model, built with batched
+# matrix constraints like create_matrix_model. Each block of variables holds all scenarios,
+# scenario by scenario.
+def create_stochastic_model(parameters, scenario_prices, weights=None):
+    import scipy.sparse as sp
+
+    battery_types = parameters['battery_types']
+    battery_types_used = parameters['battery_types_used']
+    carry_over = parameters['carry_over']
+    initial_level = parameters.get('initial_level') or {}
+
+    scenario_prices = np.atleast_2d(np.asarray(scenario_prices, dtype=float))
+    num_scenarios, num_periods = scenario_prices.shape
+
+    weights = np.full(num_scenarios, 1 / num_scenarios) if weights is None else np.asarray(weights, dtype=float)
+
+    model = gp.Model(parameters['name'])
+
+    sizes = np.array([battery_types[battery_type]['size'] for battery_type in battery_types_used])
+    costs = np.array([battery_types[battery_type]['cost'] for battery_type in battery_types_used])
+
+    # First stage, shared by every scenario. Warehouses are chosen by count per area as in
+    # create_matrix_model (unless warehouse_reduction is off).
+    counts = model.addMVar(len(battery_types_used), vtype=GRB.INTEGER, name='battery_counts', lb=0)
+    warehouse_cost, warehouses_used = add_warehouse_mvars(model, parameters, sizes @ counts)
+
+    objective = -costs @ counts - warehouse_cost
+
+    # Level in each period minus the level in the period before it, within each scenario
+    difference = sp.eye(num_periods, format='csr') - sp.eye(num_periods, k=-1, format='csr')
+    block_difference = sp.kron(sp.eye(num_scenarios, format='csr'), difference, format='csr')
+
+    ones = np.ones((num_scenarios * num_periods, 1))
+
+    level_ub = np.full(num_periods, GRB.INFINITY)
+    if not carry_over:
+        level_ub[::24] = 0
+    level_ub = np.tile(level_ub, num_scenarios)
+
+    # Probability weighted prices, so the objective is the expected profit
+    weighted_prices = (weights[:, None] * scenario_prices).ravel()
+
+    decision_var_dict = {
+        'battery_counts': dict(zip(battery_types_used, counts.tolist())),
+        'warehouses_used': warehouses_used
+    }
+
+    for i, battery_type in enumerate(battery_types_used):
+        battery = battery_types[battery_type]
+
+        buy = model.addMVar(num_scenarios * num_periods, vtype=GRB.CONTINUOUS, name=f'{battery_type}_buy', lb=0)
+        sell = model.addMVar(num_scenarios * num_periods, vtype=GRB.CONTINUOUS, name=f'{battery_type}_sell', lb=0)
+        level = model.addMVar(num_scenarios * num_periods, vtype=GRB.CONTINUOUS, name=f'{battery_type}_level', lb=0, ub=level_ub)
+
+        decision_var_dict[f'{battery_type}_buy'] = buy
+        decision_var_dict[f'{battery_type}_sell'] = sell
+        decision_var_dict[f'{battery_type}_level'] = level
+
+        battery_count = ones @ counts[i:i + 1]
+
+        start_level = np.zeros(num_scenarios * num_periods)
+        start_level[::num_periods] = initial_level.get(battery_type, 0)
+
+        model.addConstr(block_difference @ level - battery['charge_loss'] * buy + sell == start_level,
+                        name=f'{battery_type}_BalanceConstraint')
+        model.addConstr(level - battery['capacity'] * battery_count <= 0, name=f'{battery_type}_CapacityConstraint')
+        model.addConstr(battery['charge_loss'] * buy - battery['max_charge'] * battery_count <= 0,
+                        name=f'{battery_type}_ChargeConstraint')
+        model.addConstr(sell - battery['max_discharge'] * battery_count <= 0, name=f'{battery_type}_DischargeConstraint')
+
+        objective = objective + weighted_prices @ sell - weighted_prices @ buy
+
+    model.setObjective(objective, GRB.MAXIMIZE)
+
+    model.update()
+
+    return [model, decision_var_dict]
+
+def solve_extensive(parameters, scenario_prices, weights=None, verbose=False):
+    scenario_prices = np.atleast_2d(np.asarray(scenario_prices, dtype=float))
+    battery_types_used = parameters['battery_types_used']
+
+    [model, decision_var_dict] = create_stochastic_model(parameters, scenario_prices, weights)
+
+    if not verbose:
+        model.setParam('OutputFlag', 0)
+
+    model.optimize()
+
+    if model.SolCount == 0:
+        raise RuntimeError(f'No solution found (Gurobi status {model.status})')
+
+    scenario_profits = np.zeros(len(scenario_prices))
+    for battery_type in battery_types_used:
+        buy = decision_var_dict[f'{battery_type}_buy'].X.reshape(scenario_prices.shape)
+        sell = decision_var_dict[f'{battery_type}_sell'].X.reshape(scenario_prices.shape)
+
+        scenario_profits += np.sum(scenario_prices * (sell - buy), axis=1)
+
+    return {
+        'battery_counts': {battery_type: round(var.X) for battery_type, var in decision_var_dict['battery_counts'].items()},
+        'warehouses_used': fixed_warehouse_choices(var.X for var in decision_var_dict['warehouses_used'].values()),
+        'expected_profit': model.ObjVal,
+        'bound': model.ObjBound,
+        'scenario_profits': scenario_profits
+    }
+
+def solve_decomposition(parameters, scenario_prices, weights=None, tolerance=1e-4, max_iterations=100, verbose=False):
+    scenario_prices = np.atleast_2d(np.asarray(scenario_prices, dtype=float))
+    num_scenarios, num_periods = scenario_prices.shape
+
+    weights = np.full(num_scenarios, 1 / num_scenarios) if weights is None else np.asarray(weights, dtype=float)
+
+    battery_types = parameters['battery_types']
+    battery_types_used = parameters['battery_types_used']
+    warehouse_data = parameters['warehouse_data']
+    initial_level = {battery_type: (parameters.get('initial_level') or {}).get(battery_type, 0)
+                     for battery_type in battery_types_used}
+
+    costs = np.array([battery_types[battery_type]['cost'] for battery_type in battery_types_used])
+    warehouse_costs = np.array([warehouse['cost'] for warehouse in warehouse_data])
+
+    # Fewest batteries that can hold or get rid of the initial charge in the first period, with
+    # fewer the dispatch is infeasible
+    minimum_counts = np.zeros(len(battery_types_used))
+    for i, battery_type in enumerate(battery_types_used):
+        battery = battery_types[battery_type]
+        first_period_limit = battery['max_discharge'] + (battery['capacity'] if parameters['carry_over'] else 0)
+
+        minimum_counts[i] = np.ceil(initial_level[battery_type] / first_period_limit - 1e-9)
+
+    # One dispatch model for every scenario. The battery counts stay variables so their reduced
+    # costs can be read, but are made continuous and fixed to the master's values.
+    sub_parameters = dict(parameters, battery_counts=None, warehouses_used='set', formulation='state_of_charge',
+                          initial_level=initial_level)
+    times = np.datetime64('2000-01-01T00', 'h') + np.arange(num_periods).astype('timedelta64[h]')
+
+    [sub_model, sub_vars, sub_constraints] = create_model(sub_parameters, {'times': times, 'prices': scenario_prices[0]})
+
+    count_vars = [sub_vars['battery_counts'][battery_type] for battery_type in battery_types_used]
+    for var in count_vars:
+        var.VType = GRB.CONTINUOUS
+
+    if not verbose:
+        sub_model.setParam('OutputFlag', 0)
+
+    # Expected dispatch profit and its slope in each battery count, for a fixed fleet
+    def evaluate(counts):
+        sub_model.setAttr('LB', count_vars, list(counts))
+        sub_model.setAttr('UB', count_vars, list(counts))
+
+        profits = np.zeros(num_scenarios)
+        slopes = np.zeros((num_scenarios, len(count_vars)))
+
+        for s in range(num_scenarios):
+            update_daily_model(sub_model, sub_vars, sub_constraints, sub_parameters,
+                               {'times': times, 'prices': scenario_prices[s]}, initial_level)
+            sub_model.optimize()
+
+            if sub_model.status != GRB.OPTIMAL:
+                raise RuntimeError(f'Dispatch of scenario {s} not solved (Gurobi status {sub_model.status})')
+
+            # The objective includes the battery costs, add them back to get the dispatch profit
+            profits[s] = sub_model.ObjVal + costs @ counts
+            slopes[s] = np.array(sub_model.getAttr('RC', count_vars)) + costs
+
+        return profits, slopes
+
+    master = gp.Model(f"{parameters['name']}_master")
+
+    if not verbose:
+        master.setParam('OutputFlag', 0)
+
+    counts = master.addVars(len(battery_types_used), vtype=GRB.INTEGER, name='battery_counts', lb=minimum_counts.tolist())
+    expected_dispatch_profit = master.addVar(lb=-GRB.INFINITY, name='expected_dispatch_profit')
+
+    # Warehouses by count per area, as in create_model
+    warehouse_cost, warehouses_used = add_warehouse_vars(
+        master, parameters,
+        gp.quicksum(battery_types[battery_type]['size'] * counts[i] for i, battery_type in enumerate(battery_types_used))
+    )
+
+    def chosen_warehouses():
+        return np.array([choice.X for choice in warehouses_used.values()], dtype=float)
+
+    # Start from the smallest fleet, its cut bounds the master. Its warehouses are the cheapest
+    # ones that fit it.
+    candidate_counts = minimum_counts
+    master.setAttr('UB', list(counts.values()), minimum_counts.tolist())
+    master.setObjective(-warehouse_cost, GRB.MAXIMIZE)
+    master.optimize()
+
+    if master.SolCount == 0:
+        raise RuntimeError(f'No warehouses fit the initial charge (Gurobi status {master.status})')
+
+    candidate_warehouses = np.round(chosen_warehouses())
+
+    master.setAttr('UB', list(counts.values()), [GRB.INFINITY] * len(battery_types_used))
+    master.setObjective(
+        expected_dispatch_profit - counts.prod(dict(enumerate(costs))) - warehouse_cost,
+        GRB.MAXIMIZE
+    )
+
+    best = None
+    upper_bound = np.inf
+
+    for iteration in range(1, max_iterations + 1):
+        profits, slopes = evaluate(candidate_counts)
+
+        expected_profit = weights @ profits
+        slope = weights @ slopes
+
+        objective = expected_profit - costs @ candidate_counts - warehouse_costs @ candidate_warehouses
+
+        if best is None or objective > best['expected_profit']:
+            best = {
+                'battery_counts': dict(zip(battery_types_used, candidate_counts.astype(int).tolist())),
+                'warehouses_used': fixed_warehouse_choices(candidate_warehouses),
+                'expected_profit': objective,
+                'scenario_profits': profits
+            }
+
+        # The dispatch profit is concave in the counts, so the tangent is an upper bound everywhere
+        master.addConstr(
+            expected_dispatch_profit <= expected_profit + gp.quicksum(slope[i] * (counts[i] - candidate_counts[i])
+                                                                      for i in range(len(battery_types_used))),
+            name=f'cut_{iteration}'
+        )
+
+        master.optimize()
+
+        if master.SolCount == 0:
+            raise RuntimeError(f'Master problem not solved (Gurobi status {master.status})')
+
+        upper_bound = master.ObjBound
+
+        if verbose:
+            print(f"Iteration {iteration}: best {best['expected_profit']:.2f}, bound {upper_bound:.2f}")
+
+        if upper_bound - best['expected_profit'] <= tolerance * max(1, abs(best['expected_profit'])):
+            break
+
+        candidate_counts = np.round(master.getAttr('X', counts.values()))
+        candidate_warehouses = np.round(chosen_warehouses())
+
+    best['bound'] = upper_bound
+    best['iterations'] = iteration
+
+    return best
+
+# Stage one over sampled scenarios. Returns the battery counts and warehouses (the result can be
+# passed to stage_two in place of stage one's decision_var_dict), the expected profit, an upper
+# bound on it and the dispatch profit of every scenario.
+def stochastic_stage_one(start_date, parameters, num_scenarios=50, scenario_days=30, history_days=365,
+                         method='days', mode='extensive', seed=0, verbose=False):
+    dates = history_dates(start_date, history_days)
+
+    history = load_prices(parameters, dates)
+
+    if np.ndim(history['prices']) != 1:
+        raise ValueError('Scenarios are sampled from a single price series, set one generator_name')
+
+    scenario_prices = sample_scenarios(daily_price_matrix(history), num_scenarios, scenario_days, method, seed)
+
+    if mode == 'extensive':
+        return solve_extensive(parameters, scenario_prices, verbose=verbose)
+    if mode == 'decomposition':
+        return solve_decomposition(parameters, scenario_prices, verbose=verbose)
+
+    raise ValueError(f'Unknown mode: {mode}')
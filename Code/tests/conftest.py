@@ -0,0 +1,115 @@
+import os
+import sys
+import zipfile
+import threading
+import functools
+import pandas as pd
+import pytest
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+# The modules in Code import each other by name
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import web_scrape_price_data
+from web_scrape_price_data import market_timezone
+
+# Local stand-in for the NYISO site: daily {date}damlbmp_gen.csv files and monthly
+# {YYYYMM}01damlbmp_gen_csv.zip archives served over HTTP from a temporary directory.
+
+def daily_file_content(date, generators):
+    start = pd.Timestamp(date).tz_localize(market_timezone)
+    end = (pd.Timestamp(date) + pd.Timedelta(days=1)).tz_localize(market_timezone)
+
+    # Local hours of the day as NYISO writes them, 23 or 25 when the clocks change
+    hours = pd.date_range(start.tz_convert('UTC'), end.tz_convert('UTC'), freq='h', inclusive='left')
+    hours = hours.tz_convert(market_timezone).tz_localize(None)
+
+    lines = ['"Time Stamp","Name","PTID","LBMP ($/MWHr)","Marginal Cost Losses ($/MWHr)","Marginal Cost Congestion ($/MWHr)"']
+
+    for i, time in enumerate(hours):
+        for ptid, generator in enumerate(generators):
+            lines.append(f'"{time:%m/%d/%Y %H:%M}","{generator}",{ptid},{20 + i + ptid}.5,0.25,-1.5')
+
+    return '\n'.join(lines) + '\n'
+
+class PriceServer:
+    def __init__(self, directory):
+        self.directory = directory
+        self.requests = []
+
+        # Path -> number of 503 responses to send before serving it
+        self.failures = {}
+
+        server = self
+
+        class Handler(SimpleHTTPRequestHandler):
+            def do_GET(self):
+                server.requests.append(self.path)
+
+                if server.failures.get(self.path, 0) > 0:
+                    server.failures[self.path] -= 1
+                    self.send_error(503)
+                    return
+
+                super().do_GET()
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(Handler, directory=directory))
+        self.base_url = f'http://127.0.0.1:{self.httpd.server_address[1]}'
+
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+
+    def add_daily_file(self, date, generators):
+        with open(os.path.join(self.directory, f'{date}damlbmp_gen.csv'), 'w') as day_file:
+            day_file.write(daily_file_content(date, generators))
+
+    def add_monthly_zip(self, year_month, dates, generators):
+        with zipfile.ZipFile(os.path.join(self.directory, f'{year_month}01damlbmp_gen_csv.zip'), 'w') as zip_file:
+            for date in dates:
+                zip_file.writestr(f'{date}damlbmp_gen.csv', daily_file_content(date, generators))
+
+    def requests_for(self, name):
+        return [path for path in self.requests if path.endswith(name)]
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+@pytest.fixture
+def price_server(tmp_path):
+    site_directory = tmp_path / 'site'
+    site_directory.mkdir()
+
+    server = PriceServer(str(site_directory))
+
+    yield server
+
+    server.close()
+
+# Point the downloader at an empty Data directory
+@pytest.fixture
+def data_directory(tmp_path, monkeypatch):
+    directory = tmp_path / 'Data'
+    directory.mkdir()
+
+    monkeypatch.setattr(web_scrape_price_data, 'storage_directory', str(directory))
+    monkeypatch.setattr(web_scrape_price_data, 'zip_index_path', str(directory / 'zip_index.json'))
+
+    return directory
+
+# Skips the test without gurobipy or a licence that can start an environment
+@pytest.fixture
+def gurobi():
+    gp = pytest.importorskip('gurobipy')
+
+    try:
+        gp.Env(params={'OutputFlag': 0}).dispose()
+    except gp.GurobiError as error:
+        pytest.skip(f'No Gurobi licence ({error})')
+
+    gp.setParam('OutputFlag', 0)
+
+    return gp
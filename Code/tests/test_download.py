@@ -0,0 +1,96 @@
+import os
+import json
+import time
+import pandas as pd
+
+from web_scrape_price_data import download_price_data, fetch_price_files
+
+
+def test_daily_csv_is_downloaded_and_split(price_server, data_directory):
+    price_server.add_daily_file('20231201', ['GEN A', 'GEN B'])
+
+    failed = download_price_data(['20231201'], 'GEN A', base_url=price_server.base_url)
+
+    assert failed == []
+    assert price_server.requests_for('/20231201damlbmp_gen.csv') == ['/20231201damlbmp_gen.csv']
+
+    price_df = pd.read_csv(data_directory / '20231201_GEN A.csv')
+    assert list(price_df.columns) == ['time', 'LB_MargPrice', 'MargCostLosses', 'MargCostCongestion']
+    assert len(price_df) == 24
+
+    # Already on disk, nothing is fetched again
+    download_price_data(['20231201'], 'GEN A', base_url=price_server.base_url)
+    assert len(price_server.requests) == 1
+
+def test_days_without_daily_file_are_read_from_the_monthly_zip(price_server, data_directory):
+    price_server.add_monthly_zip('202311', ['20231129', '20231130'], ['GEN A', 'GEN B'])
+
+    failed = download_price_data(['20231129', '20231130'], 'GEN A', base_url=price_server.base_url)
+
+    assert failed == []
+
+    # One archive for both days, and only the wanted generator is written
+    assert len(price_server.requests_for('/20231101damlbmp_gen_csv.zip')) == 1
+    assert os.path.exists(data_directory / '20231129_GEN A.csv')
+    assert os.path.exists(data_directory / '20231130_GEN A.csv')
+    assert not os.path.exists(data_directory / '20231130_GEN B.csv')
+
+    with open(data_directory / 'zip_index.json') as index_file:
+        assert json.load(index_file)['202311']['20231130'] == ['GEN A']
+
+def test_lost_file_is_read_from_the_monthly_zip_again(price_server, data_directory):
+    price_server.add_monthly_zip('202311', ['20231129'], ['GEN A'])
+
+    assert download_price_data(['20231129'], 'GEN A', base_url=price_server.base_url) == []
+
+    # The zip index still lists the day, but its file is gone
+    os.remove(data_directory / '20231129_GEN A.csv')
+
+    assert download_price_data(['20231129'], 'GEN A', base_url=price_server.base_url) == []
+    assert len(price_server.requests_for('/20231101damlbmp_gen_csv.zip')) == 2
+    assert os.path.exists(data_directory / '20231129_GEN A.csv')
+
+def test_failed_requests_are_retried(price_server, data_directory):
+    price_server.add_daily_file('20231201', ['GEN A'])
+    price_server.failures['/20231201damlbmp_gen.csv'] = 2
+
+    failed = fetch_price_files(['20231201'], base_url=price_server.base_url, retries=3, backoff=0)
+
+    assert failed == []
+    assert len(price_server.requests_for('/20231201damlbmp_gen.csv')) == 3
+    assert os.path.exists(data_directory / '20231201damlbmp_gen.csv')
+
+def test_retries_back_off_and_give_up(price_server, data_directory):
+    price_server.add_daily_file('20231201', ['GEN A'])
+    price_server.failures['/20231201damlbmp_gen.csv'] = 10
+
+    start = time.perf_counter()
+    failed = fetch_price_files(['20231201'], base_url=price_server.base_url, retries=3, backoff=0.1)
+    elapsed = time.perf_counter() - start
+
+    assert failed == ['20231201']
+    assert len(price_server.requests_for('/20231201damlbmp_gen.csv')) == 4
+
+    # Waits 0.2s and 0.4s before the last two retries
+    assert elapsed >= 0.5
+    assert not os.path.exists(data_directory / '20231201damlbmp_gen.csv')
+
+def test_failed_dates_are_returned_and_not_split(price_server, data_directory):
+    price_server.add_daily_file('20231201', ['GEN A'])
+
+    # Neither a daily file nor a monthly archive for the second day
+    failed = download_price_data(['20231201', '20231202'], 'GEN A', base_url=price_server.base_url)
+
+    assert failed == ['20231202']
+    assert os.path.exists(data_directory / '20231201_GEN A.csv')
+    assert not os.path.exists(data_directory / '20231202_GEN A.csv')
+
+def test_days_without_the_generator_are_returned(price_server, data_directory):
+    price_server.add_daily_file('20231201', ['GEN B'])
+    price_server.add_monthly_zip('202311', ['20231129'], ['GEN A'])
+
+    # The daily file has no GEN A rows, and the archive has no 20231130 file
+    failed = download_price_data(['20231129', '20231130', '20231201'], 'GEN A', base_url=price_server.base_url)
+
+    assert failed == ['20231130', '20231201']
+    assert os.path.exists(data_directory / '20231129_GEN A.csv')
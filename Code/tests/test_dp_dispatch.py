@@ -0,0 +1,53 @@
+import copy
+import numpy as np
+import pytest
+
+from benchmark_formulations import parameters, make_synthetic_prices
+from dp_dispatch import solve_dispatch
+from web_scrape_price_data import download_price_data
+
+
+def fleet_parameters(carry_over, initial_level=None):
+    return dict(copy.deepcopy(parameters), battery_counts={'lithium': 2, 'lead': 1, 'palladium': 3},
+                warehouses_used='set', formulation='state_of_charge', carry_over=carry_over, initial_level=initial_level)
+
+@pytest.mark.parametrize('carry_over', [False, True])
+@pytest.mark.parametrize('price_shift', [0, -45])
+def test_dispatch_matches_the_lp(gurobi, carry_over, price_shift):
+    from run_model import run
+
+    # Shifted down, some of the prices are negative
+    prices_dict = make_synthetic_prices(3)
+    prices_dict['prices'] = prices_dict['prices'] + price_shift
+
+    initial_level = {'lead': 20} if carry_over else None
+
+    [model_results, _] = solve_dispatch(fleet_parameters(carry_over, initial_level), prices_dict)
+    [_, _, lp_results, _] = run(fleet_parameters(carry_over, initial_level), prices_dict=prices_dict)
+
+    assert model_results['total_profit'] == pytest.approx(lp_results['total_profit'], rel=1e-9, abs=1e-6)
+
+    if price_shift < 0:
+        assert np.min(prices_dict['prices']) < 0
+
+def test_list_of_generators_reaches_the_single_series_check(price_server, data_directory):
+    price_server.add_daily_file('20231103', ['GEN A', 'GEN B'])
+    download_price_data(['20231103'], ['GEN A', 'GEN B'], base_url=price_server.base_url)
+
+    run_parameters = dict(fleet_parameters(False), generator_name=['GEN A', 'GEN B'], date_range=['20231103'])
+
+    with pytest.raises(ValueError, match='single price series'):
+        solve_dispatch(run_parameters)
+
+def test_run_loads_and_times_the_prices(gurobi, price_server, data_directory):
+    from run_model import run
+
+    price_server.add_daily_file('20231103', ['GEN A'])
+    download_price_data(['20231103'], 'GEN A', base_url=price_server.base_url)
+
+    run_parameters = dict(fleet_parameters(False), generator_name='GEN A', date_range=['20231103'])
+
+    [_, _, model_results, constraint_params] = run(run_parameters)
+
+    assert len(constraint_params['prices']) == 24
+    assert {'download', 'parse', 'build', 'solve'} <= set(model_results['stats']['stages'])
@@ -0,0 +1,31 @@
+import pytest
+
+from benchmark_formulations import horizon_parameters, make_synthetic_prices
+
+
+def solve(formulation, num_days):
+    from run_model import create_model, create_matrix_model
+
+    run_parameters = horizon_parameters(num_days)
+    prices_dict = make_synthetic_prices(num_days)
+
+    if formulation == 'matrix':
+        [model, _, _] = create_matrix_model(run_parameters, prices_dict)
+    else:
+        run_parameters['formulation'] = formulation
+        [model, _, _] = create_model(run_parameters, prices_dict)
+
+    model.optimize()
+
+    return model.objVal
+
+@pytest.mark.parametrize('carry_over', [False, True])
+def test_formulations_reach_the_same_objective(gurobi, carry_over, monkeypatch):
+    import benchmark_formulations
+    monkeypatch.setitem(benchmark_formulations.parameters, 'carry_over', carry_over)
+
+    objectives = [solve(formulation, 2) for formulation in ['cumulative', 'state_of_charge', 'matrix']]
+
+    # A fleet is bought, so the comparison isn't between empty models
+    assert objectives[0] > 0
+    assert objectives == pytest.approx([objectives[0]] * 3, rel=1e-6)
@@ -0,0 +1,120 @@
+import os
+import pytest
+
+import price_ingest
+from price_ingest import ingest, connect, find_gaps, save_records, manifest_statuses, acquire_lock, release_lock
+
+
+@pytest.fixture
+def ingest_directory(data_directory, monkeypatch):
+    monkeypatch.setattr(price_ingest, 'storage_directory', str(data_directory))
+    monkeypatch.setattr(price_ingest, 'manifest_path', str(data_directory / 'manifest.sqlite'))
+    monkeypatch.setattr(price_ingest, 'lock_path', str(data_directory / 'ingest.lock'))
+
+    return data_directory
+
+def record(date, generator, status):
+    return {'date': date, 'generator': generator, 'status': status, 'rows': None, 'checksum': None, 'error': None}
+
+def statuses():
+    connection = connect()
+    result = manifest_statuses(connection)
+    connection.close()
+
+    return result
+
+
+def test_gaps_are_missing_days_and_earlier_failures_of_the_same_generators(ingest_directory):
+    connection = connect()
+    save_records(connection, [
+        record('20231120', 'GEN A', 'failed'),
+        record('20231121', 'GEN B', 'invalid'),
+        record('20231201', 'GEN A', 'ok'),
+        record('20231202', 'GEN A', 'ok'),
+        record('20231202', 'GEN B', 'failed'),
+        record('20231122', '*', 'failed')
+    ])
+
+    dates = ['20231201', '20231202', '20231203']
+
+    assert find_gaps(connection, dates, ['GEN A']) == ['20231120', '20231203']
+    assert find_gaps(connection, dates, ['GEN A', 'GEN B']) == ['20231120', '20231121', '20231201', '20231202', '20231203']
+    assert find_gaps(connection, dates, 'all') == ['20231122'] + dates
+
+def test_only_new_days_are_fetched(price_server, ingest_directory):
+    for date in ['20231201', '20231202', '20231203']:
+        price_server.add_daily_file(date, ['GEN A', 'GEN B'])
+
+    assert ingest('20231201', '20231202', ['GEN A'], base_url=price_server.base_url) == []
+    assert ingest('20231201', '20231203', ['GEN A'], base_url=price_server.base_url) == []
+
+    assert len(price_server.requests_for('/20231201damlbmp_gen.csv')) == 1
+    assert len(price_server.requests_for('/20231203damlbmp_gen.csv')) == 1
+    assert statuses()[('20231203', 'GEN A')] == 'ok'
+
+def test_failed_day_is_retried_by_the_next_run(price_server, ingest_directory):
+    price_server.add_daily_file('20231201', ['GEN A'])
+
+    # Neither a daily file nor a monthly archive for the second day yet
+    assert ingest('20231201', '20231202', ['GEN A'], base_url=price_server.base_url) == ['20231202']
+    assert statuses()[('20231202', 'GEN A')] == 'failed'
+
+    price_server.add_daily_file('20231202', ['GEN A'])
+    price_server.add_daily_file('20231203', ['GEN A'])
+
+    # Continues from the last run, which got to the end
+    assert ingest(None, '20231203', ['GEN A'], base_url=price_server.base_url) == []
+    assert statuses()[('20231202', 'GEN A')] == 'ok'
+    assert os.path.exists(ingest_directory / '20231202_GEN A.csv')
+
+def test_changed_file_is_invalidated_and_fetched_again(price_server, ingest_directory):
+    price_server.add_daily_file('20231201', ['GEN A'])
+
+    assert ingest('20231201', '20231201', ['GEN A'], base_url=price_server.base_url) == []
+
+    path = ingest_directory / '20231201_GEN A.csv'
+    original = path.read_text()
+    path.write_text(original.replace('20.5', '99.5', 1))
+
+    # Without verify the changed file isn't noticed
+    assert ingest('20231201', '20231201', ['GEN A'], base_url=price_server.base_url) == []
+    assert path.read_text() != original
+
+    assert ingest('20231201', '20231201', ['GEN A'], base_url=price_server.base_url, verify=True) == []
+    assert path.read_text() == original
+    assert statuses()[('20231201', 'GEN A')] == 'ok'
+
+    # The day's file was downloaded again rather than split from the old copy
+    assert len(price_server.requests_for('/20231201damlbmp_gen.csv')) == 2
+
+def test_overlapping_run_exits_while_the_lock_is_held(price_server, ingest_directory):
+    price_server.add_daily_file('20231201', ['GEN A'])
+
+    lock = acquire_lock()
+
+    try:
+        assert ingest('20231201', '20231201', ['GEN A'], base_url=price_server.base_url) is None
+        assert price_server.requests == []
+    finally:
+        release_lock(lock)
+
+    assert ingest('20231201', '20231201', ['GEN A'], base_url=price_server.base_url) == []
+
+def test_reingest_keeps_other_generators_files(price_server, ingest_directory):
+    price_server.add_daily_file('20231101', ['GEN A', 'GEN B'])
+
+    other_path = ingest_directory / '20231101_GEN B.csv'
+    other_path.write_text('time,LB_MargPrice,MargCostLosses,MargCostCongestion\n11/01/2023 00:00,1.0,0.0,0.0\n')
+
+    # GEN B failed on an earlier day, a run for GEN A must leave that to GEN B's runs
+    connection = connect()
+    save_records(connection, [record('20231031', 'GEN B', 'failed'), record('20231101', 'GEN A', 'invalid')])
+    connection.close()
+
+    assert ingest('20231101', '20231101', ['GEN A'], base_url=price_server.base_url) == []
+
+    assert other_path.read_text().endswith('11/01/2023 00:00,1.0,0.0,0.0\n')
+    assert os.path.exists(ingest_directory / '20231101damlbmp_gen.csv')
+    assert statuses()[('20231101', 'GEN A')] == 'ok'
+    assert statuses()[('20231031', 'GEN B')] == 'failed'
+    assert price_server.requests_for('/20231031damlbmp_gen.csv') == []
@@ -0,0 +1,63 @@
+import os
+import numpy as np
+import pytest
+
+import price_matrix
+from price_matrix import build_matrix, open_matrix
+from web_scrape_price_data import download_price_data, extract_time_series_prices, extract_price_matrix
+
+# 20231105 is the 25 hour day when clocks go back
+dates = ['20231104', '20231105', '20231106']
+
+
+@pytest.fixture
+def matrix(price_server, data_directory, tmp_path, monkeypatch):
+    for date in dates:
+        price_server.add_daily_file(date, ['GEN A', 'GEN B'])
+
+    download_price_data(dates, 'GEN A', base_url=price_server.base_url)
+    download_price_data(dates, 'GEN B', base_url=price_server.base_url)
+
+    # GEN B has no prices for the last day
+    os.remove(data_directory / '20231106_GEN B.csv')
+
+    matrix_directory = str(tmp_path / 'price_matrix')
+    monkeypatch.setattr(price_matrix, 'matrix_directory', matrix_directory)
+
+    build_matrix(storage_directory=str(data_directory), matrix_directory=matrix_directory)
+
+    return open_matrix()
+
+
+def test_consecutive_dates_are_float32_views_of_the_matrix(matrix):
+    prices_dict = extract_time_series_prices(dates, 'GEN A', source='matrix')
+    csv_prices = extract_time_series_prices(dates, 'GEN A')
+
+    assert prices_dict['prices'].dtype == np.float32
+    assert np.shares_memory(prices_dict['prices'], matrix['LB_MargPrice'])
+    assert np.shares_memory(prices_dict['marg_cost_cong'], matrix['MargCostCongestion'])
+
+    assert len(prices_dict['prices']) == 73
+    assert len(prices_dict['duplicate_times']) == 1
+    assert np.array_equal(prices_dict['times'], csv_prices['times'])
+    assert np.allclose(prices_dict['prices'], csv_prices['prices'])
+
+def test_several_generators_are_one_view(matrix):
+    prices_dict = extract_price_matrix(dates[:2], ['GEN A', 'GEN B'], source='matrix')
+
+    assert prices_dict['prices'].shape == (2, 49)
+    assert np.shares_memory(prices_dict['prices'], matrix['LB_MargPrice'])
+    assert np.allclose(prices_dict['prices'], extract_price_matrix(dates[:2], ['GEN A', 'GEN B'])['prices'])
+
+def test_hours_without_data_and_scattered_dates_are_copied(matrix):
+    # The hours GEN B has no file for are left out
+    prices_dict = extract_price_matrix(dates, ['GEN A', 'GEN B'], source='matrix')
+
+    assert prices_dict['prices'].shape == (2, 49)
+    assert not np.isnan(prices_dict['prices']).any()
+    assert not np.shares_memory(prices_dict['prices'], matrix['LB_MargPrice'])
+
+    prices_dict = extract_time_series_prices(['20231104', '20231106'], 'GEN A', source='matrix')
+
+    assert prices_dict['prices'].dtype == np.float32
+    assert np.allclose(prices_dict['prices'], extract_time_series_prices(['20231104', '20231106'], 'GEN A')['prices'])
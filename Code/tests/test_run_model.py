@@ -0,0 +1,41 @@
+import copy
+import numpy as np
+import pytest
+
+from benchmark_formulations import parameters, make_synthetic_prices
+
+
+def node_prices(num_nodes, num_days=1):
+    prices_dict = make_synthetic_prices(num_days)
+    prices_dict['prices'] = np.vstack([prices_dict['prices'] + 5 * n for n in range(num_nodes)])
+    prices_dict['generator_names'] = [f'GEN {n}' for n in range(num_nodes)]
+
+    return prices_dict
+
+@pytest.mark.parametrize('formulation, builder', [('cumulative', 'loop'), ('state_of_charge', 'loop'), ('state_of_charge', 'matrix')])
+@pytest.mark.parametrize('num_nodes', [1, 2])
+def test_prices_of_a_list_of_generators_keep_a_row_per_node(gurobi, formulation, builder, num_nodes):
+    from run_model import run
+
+    run_parameters = dict(copy.deepcopy(parameters), formulation=formulation, builder=builder, num_markets=num_nodes)
+
+    [_, _, model_results, _] = run(run_parameters, prices_dict=node_prices(num_nodes))
+
+    assert model_results is not None
+    assert model_results['buy_ts']['lithium'].shape == (num_nodes, 24)
+    assert model_results['sell_ts']['lithium'].shape == (num_nodes, 24)
+
+def test_several_nodes_are_plotted(gurobi, tmp_path):
+    import matplotlib
+    matplotlib.use('Agg')
+
+    from run_model import run
+    from make_plots import plot_result_time_series
+
+    run_parameters = dict(copy.deepcopy(parameters), num_markets=2)
+
+    [model, decision_var_dict, model_results, constraint_params] = run(run_parameters, prices_dict=node_prices(2))
+
+    plot_result_time_series(model, decision_var_dict, model_results, constraint_params, save_path=tmp_path / 'results.png')
+
+    assert (tmp_path / 'results.png').exists()
@@ -0,0 +1,35 @@
+import sys
+import copy
+import pytest
+
+import solve_cache
+from solve_cache import cached_run, cache_key
+from benchmark_formulations import parameters, make_synthetic_prices
+from dp_dispatch import solve_dispatch
+
+
+def dp_parameters():
+    return dict(copy.deepcopy(parameters), solver='dp', battery_counts={'lithium': 2, 'lead': 1, 'palladium': 3},
+                warehouses_used='set', formulation='state_of_charge')
+
+def test_dp_solver_is_used_and_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(solve_cache, 'cache_stats', {'hits': 0, 'misses': 0})
+
+    # A dp run must not reach for Gurobi
+    monkeypatch.setitem(sys.modules, 'run_model', None)
+
+    prices_dict = make_synthetic_prices(2)
+    [expected, _] = solve_dispatch(dp_parameters(), prices_dict)
+
+    [model_results, solution, _] = cached_run(dp_parameters(), prices_dict, cache_directory=str(tmp_path))
+    assert solution['objective'] == pytest.approx(expected['total_profit'])
+
+    [model_results, solution, _] = cached_run(dp_parameters(), prices_dict, cache_directory=str(tmp_path))
+    assert solve_cache.cache_stats == {'hits': 1, 'misses': 1}
+    assert model_results['total_profit'] == pytest.approx(expected['total_profit'])
+    assert (model_results['sell_ts']['lead'] == expected['sell_ts']['lead']).all()
+
+def test_solvers_have_their_own_entries():
+    prices = make_synthetic_prices(1)['prices']
+
+    assert cache_key(dp_parameters(), prices) != cache_key(dict(dp_parameters(), solver='gurobi'), prices)
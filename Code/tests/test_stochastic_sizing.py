@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+
+from benchmark_formulations import horizon_parameters, make_synthetic_prices
+
+
+def sizing_parameters(warehouse_reduction):
+    run_parameters = horizon_parameters(1)
+    run_parameters['battery_types_used'] = ['lithium', 'palladium']
+    run_parameters['warehouse_reduction'] = warehouse_reduction
+
+    # Two areas, the 50s only differ in cost
+    run_parameters['warehouse_data'] = [{'area': area, 'cost': cost * 40 / 365}
+                                        for area, cost in [(50, 40000), (50, 20000), (50, 60000), (100, 30000), (100, 50000)]]
+
+    return run_parameters
+
+def scenario_prices(num_scenarios=3):
+    rng = np.random.default_rng(1)
+
+    return make_synthetic_prices(1)['prices'] + 5 * rng.standard_normal((num_scenarios, 24))
+
+@pytest.mark.parametrize('warehouse_reduction', [True, False])
+def test_extensive_and_decomposition_pick_the_same_fleet(gurobi, warehouse_reduction):
+    from stochastic_sizing import solve_extensive, solve_decomposition
+
+    results = [solve(sizing_parameters(warehouse_reduction), scenario_prices()) for solve in [solve_extensive, solve_decomposition]]
+
+    for result in results:
+        assert result['battery_counts'] == results[0]['battery_counts']
+        assert result['expected_profit'] == pytest.approx(results[0]['expected_profit'], rel=1e-6)
+
+        # Same shape as create_model's decision_var_dict, the cheapest 50 is taken
+        assert [choice.x for choice in result['warehouses_used'].values()] == [0, 1, 0, 1, 1]
+
+def test_extensive_model_counts_warehouses_per_area(gurobi):
+    from stochastic_sizing import create_stochastic_model
+
+    [model, _] = create_stochastic_model(sizing_parameters(True), scenario_prices())
+
+    assert model.NumBinVars == 0
+    assert model.NumIntVars == 2 + 2
@@ -1,5 +1,9 @@
-from run_model import run
-from web_scrape_price_data import get_preceding_30_days
+import numpy as np
+
+from run_model import run, create_model
+from scenarios import run_scenarios, daily_windows
+from dp_dispatch import solve_dispatch
+from web_scrape_price_data import get_preceding_30_days, download_prices, load_prices
 from datetime import datetime, timedelta
 
 # Get battery numbers
@@ -9,7 +13,68 @@ def stage_one(start_date, parameters):
 
     return run(parameters)
 
-def stage_two(start_date, parameters, decision_var_dict):
+# Swap a new day's prices (and starting charge) into an already built daily model
+def update_daily_model(model, decision_var_dict, constraint_params, parameters, prices_dict, initial_level):
+    prices = prices_dict['prices']
+
+    # In variable order, node by node when trading at several nodes
+    objective_prices = np.ravel(prices).tolist()
+
+    for battery_type in parameters['battery_types_used']:
+        buy = decision_var_dict[f'{battery_type}_buy']
+        sell = decision_var_dict[f'{battery_type}_sell']
+
+        model.setAttr('Obj', list(buy.values()), [-price for price in objective_prices])
+        model.setAttr('Obj', list(sell.values()), objective_prices)
+
+        constraint_params['initial_balance'][battery_type].RHS = initial_level[battery_type]
+
+    constraint_params['price_times'] = prices_dict['times']
+    constraint_params['prices'] = prices
+
+# Solver for one day of dispatch with the fleet in parameters fixed. solve(date, prices_dict,
+# initial_level) returns the day's profit and the charge left at the end of the day.
+def daily_solver(parameters):
+    battery_types_used = parameters['battery_types_used']
+
+    # The daily models need a level variable per period so the starting charge can be changed
+    daily_parameters = dict(parameters, formulation='state_of_charge')
+
+    # Built once per day length (DST days have 23 or 25 hours) and reused after that
+    daily_models = {}
+
+    def solve(date, prices_dict, initial_level):
+        # With the fleet fixed the days can be solved by dynamic programming, without Gurobi
+        if parameters.get('solver') == 'dp':
+            [model_results, _] = solve_dispatch(dict(parameters, initial_level=initial_level), prices_dict)
+
+            return model_results['total_profit'], {battery_type: model_results['level_ts'][battery_type][-1]
+                                                   for battery_type in battery_types_used}
+
+        num_periods = np.shape(prices_dict['prices'])[-1]
+
+        if num_periods not in daily_models:
+            daily_parameters['date_range'] = [date]
+            daily_models[num_periods] = create_model(daily_parameters, prices_dict)
+
+        [model, day_var_dict, constraint_params] = daily_models[num_periods]
+
+        # Only the objective and the starting charge change between days, so Gurobi re-solves
+        # from the previous day's basis. Pass the previous solution as a MIP start as well.
+        if model.IsMIP and model.SolCount > 0:
+            model_vars = model.getVars()
+            model.setAttr('Start', model_vars, model.getAttr('X', model_vars))
+
+        update_daily_model(model, day_var_dict, constraint_params, daily_parameters, prices_dict, initial_level)
+
+        model.optimize()
+
+        return model.objVal, {battery_type: day_var_dict[f'{battery_type}_level'][num_periods - 1].x
+                              for battery_type in battery_types_used}
+
+    return solve
+
+def stage_two(start_date, parameters, decision_var_dict, max_workers=None, threads_per_worker=1):
     parameters['battery_counts'] = decision_var_dict['battery_counts']
     parameters['warehouses_used'] = 'set'
     parameters['date_range'] = [start_date.strftime("%Y%m%d")]
@@ -17,11 +82,31 @@ def stage_two(start_date, parameters, decision_var_dict):
     daily_profits = []
     start_date = datetime.today() - timedelta(days=1)
 
-    for start_date in get_preceding_30_days(start_date):
-        parameters['date_range'] = [start_date]
+    date_range = get_preceding_30_days(start_date)
+    battery_types_used = parameters['battery_types_used']
+
+    # 'store' and 'matrix' read prices that are already stored locally
+    download_prices(parameters, date_range)
+
+    # Without carry over the days don't depend on each other and can be solved in parallel.
+    # Days that fail come back as None.
+    if max_workers is not None and not parameters['carry_over']:
+        results = run_scenarios(daily_windows(date_range), base_parameters=parameters, max_workers=max_workers,
+                                threads_per_worker=threads_per_worker, download_first=False)
+
+        return [result.get('objective') for result in results]
+
+    solve = daily_solver(parameters)
+    initial_level = {battery_type: 0 for battery_type in battery_types_used}
+
+    for date in date_range:
+        prices_dict = load_prices(parameters, [date], download=False)
 
-        [model, _, _, _] = run(parameters)
+        profit, final_level = solve(date, prices_dict, initial_level)
+        daily_profits.append(profit)
 
-        daily_profits.append(model.objVal)
+        # Carry the charge left at the end of the day into the next day
+        if parameters['carry_over']:
+            initial_level = final_level
 
     return daily_profits
@@ -1,14 +1,22 @@
+import io
 import os
 import re
+import glob
 import sys
+import json
 import time
 import shutil
 import zipfile
-import requests
-import pandas as pd
-from selenium import webdriver
+import tempfile
+import numpy as np
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from webdriver_manager.chrome import ChromeDriverManager
+
+from instrumentation import stage
+
+# pandas is imported inside the functions that read and parse prices, it is slow to import and
+# run_model imports this module at start up
 
 columns = ['Time Stamp', 'LBMP ($/MWHr)', 'Marginal Cost Losses ($/MWHr)', 'Marginal Cost Congestion ($/MWHr)']
 
@@ -25,9 +33,14 @@ home_dir = os.getcwd()
 download_directory = os.path.join(home_dir, 'Downloads_CSV')
 storage_directory = os.path.join(home_dir, 'Data')
 
-print("storage_directory: ", storage_directory)
-print("download_directory: ", download_directory)
-print("home_dir: ", home_dir)
+nyiso_base_url = 'http://mis.nyiso.com/public/csv/damlbmp'
+
+# NYISO times are local New York time
+market_timezone = 'America/New_York'
+
+# Record of which days (and generators) have been read out of the monthly archives
+zip_index_path = os.path.join(storage_directory, 'zip_index.json')
+
 
 def extract_date(file_path):
     match = re.match(r'^(\d+)', file_path.split('/')[4])
@@ -50,7 +63,181 @@ def get_preceding_30_days(input_date):
 
     return date_list
 
-def download_price_data(date_range, generator_name):
+def daily_csv_url(date, base_url=nyiso_base_url):
+    return f'{base_url}/{date}damlbmp_gen.csv'
+
+def monthly_zip_url(year_month, base_url=nyiso_base_url):
+    return f'{base_url}/{year_month}01damlbmp_gen_csv.zip'
+
+# Pooled session that retries failed requests with exponential backoff
+def make_session(max_connections=8, retries=3, backoff=0.5):
+    # The HTTP and browser libraries are only imported by the code that downloads, so reading
+    # prices that are already on disk doesn't pay for them
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    retry = Retry(total=retries, backoff_factor=backoff, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(pool_connections=max_connections, pool_maxsize=max_connections, max_retries=retry)
+
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+def _write_file(path, content):
+    # Write to a temporary file first so an interrupted download never leaves a partial file
+    with open(path + '.part', 'wb') as file:
+        file.write(content)
+
+    os.replace(path + '.part', path)
+
+def _fetch_daily_csv(session, date, base_url, timeout):
+    import requests
+
+    try:
+        response = session.get(daily_csv_url(date, base_url), timeout=timeout)
+
+        # Older days are only published in the monthly archive
+        if response.status_code == 404:
+            return 'missing'
+
+        response.raise_for_status()
+        _write_file(f'{storage_directory}/{date}damlbmp_gen.csv', response.content)
+
+        return 'ok'
+
+    except requests.RequestException as error:
+        print(f'Failed to download price data for date: {date} ({error})')
+
+        return 'failed'
+
+def load_zip_index():
+    if not os.path.exists(zip_index_path):
+        return {}
+
+    with open(zip_index_path) as index_file:
+        return json.load(index_file)
+
+def save_zip_index(index):
+    _write_file(zip_index_path, json.dumps(index, indent=1, sort_keys=True).encode())
+
+# True if the monthly archive has already been read for this date and these generators, and
+# the files it wrote are still there (a lost file means the archive is read again)
+def zip_ingested(index, date, generator_names):
+    ingested = index.get(date[0:6], {}).get(date)
+
+    if ingested is None:
+        return False
+
+    if generator_names is None:
+        return ingested == 'all' and os.path.exists(f'{storage_directory}/{date}damlbmp_gen.csv')
+
+    if ingested != 'all' and (generator_names == 'all' or not set(generator_names) <= set(ingested)):
+        return False
+
+    return len(missing_generators(date, generator_names)) == 0
+
+# Read the wanted days straight out of a monthly archive, member by member, without
+# extracting the rest of the month. With generator_names the day is split into
+# {date}_{generator}.csv files directly, otherwise the day's damlbmp_gen file is written.
+def ingest_monthly_zip(zip_source, dates, generator_names=None, chunksize=100000):
+    index = load_zip_index()
+    ingested = []
+
+    with zipfile.ZipFile(zip_source) as zip_ref:
+        members = set(zip_ref.namelist())
+
+        for date in dates:
+            member = f'{date}damlbmp_gen.csv'
+
+            if member not in members:
+                print(f'...No price data in the monthly archive for date: {date}')
+                continue
+
+            with zip_ref.open(member) as member_file:
+                if generator_names is None:
+                    with open(f'{storage_directory}/{member}.part', 'wb') as day_file:
+                        shutil.copyfileobj(member_file, day_file)
+                    os.replace(f'{storage_directory}/{member}.part', f'{storage_directory}/{member}')
+
+                    written = 'all'
+                else:
+                    written = split_daily_file(member_file, date, generator_names, chunksize)
+
+                    if generator_names == 'all':
+                        written = 'all'
+
+            month_index = index.setdefault(date[0:6], {})
+            previous = month_index.get(date, [])
+
+            if written == 'all' or previous == 'all':
+                month_index[date] = 'all'
+            else:
+                month_index[date] = sorted(set(previous) | set(generator_names))
+
+            ingested.append(date)
+
+    save_zip_index(index)
+
+    return ingested
+
+def _fetch_monthly_zip(session, year_month, dates, generator_names, base_url, timeout):
+    import requests
+
+    try:
+        # Stream the archive into a spooled temporary file, it only touches disk if it is large
+        with session.get(monthly_zip_url(year_month, base_url), timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+
+            with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024) as zip_file:
+                for block in response.iter_content(chunk_size=1024 * 1024):
+                    zip_file.write(block)
+
+                zip_file.seek(0)
+                ingest_monthly_zip(zip_file, dates, generator_names)
+
+        return 'ok'
+
+    except (requests.RequestException, zipfile.BadZipFile) as error:
+        print(f'Failed to download the zip file for month: {year_month} ({error})')
+
+        return 'failed'
+
+# Download the {date}damlbmp_gen.csv files for the given dates into the storage directory.
+# Days without a daily file are read from the monthly zip instead, fetched at most once per
+# month. With generator_names only those generators' files are written for the zip days.
+# Daily files already on disk are skipped, except for the refresh_dates, whose files are only
+# replaced once the new one has arrived.
+def fetch_price_files(dates, generator_names=None, base_url=nyiso_base_url, max_workers=8, retries=3, backoff=0.5, timeout=10,
+                      refresh_dates=()):
+    if not os.path.exists(storage_directory):
+        os.makedirs(storage_directory)
+
+    dates = [date for date in dates
+             if date in refresh_dates or not os.path.exists(f'{storage_directory}/{date}damlbmp_gen.csv')]
+
+    with make_session(max_workers, retries, backoff) as session, ThreadPoolExecutor(max_workers) as executor:
+        statuses = list(executor.map(lambda date: _fetch_daily_csv(session, date, base_url, timeout), dates))
+
+        # Skip days a previous run already read out of the monthly archive
+        index = load_zip_index()
+        zip_dates = [date for date, status in zip(dates, statuses)
+                     if status == 'missing' and not zip_ingested(index, date, generator_names)]
+
+        months = sorted({date[0:6] for date in zip_dates})
+
+        # One month at a time so only one archive is held at once and the index isn't written concurrently
+        month_statuses = [_fetch_monthly_zip(session, year_month, [date for date in zip_dates if date[0:6] == year_month],
+                                             generator_names, base_url, timeout) for year_month in months]
+
+    failed_months = {year_month for year_month, status in zip(months, month_statuses) if status == 'failed'}
+
+    return [date for date, status in zip(dates, statuses)
+            if status == 'failed' or (status == 'missing' and date[0:6] in failed_months)]
+
+def download_price_data(date_range, generator_name, method='http', base_url=nyiso_base_url, max_workers=8):
     print("\n\nDownloading price data...\n", '-'*70, sep='')
 
     if date_range == None:
@@ -59,203 +246,513 @@ def download_price_data(date_range, generator_name):
 
         date_range = [download_date]
 
+    generator_names = generator_name
+    if generator_names != 'all' and isinstance(generator_names, str):
+        generator_names = [generator_names]
+
     # Create list of dates to download
     dates_to_download = []
+    failed_dates = []
     for date in date_range:
-        if os.path.exists(f'{storage_directory}/{date}_{generator_name}.csv'):
+        if len(missing_generators(date, generator_names)) == 0:
             print(f'...Price data already downloaded for date: {date}, Generator: {generator_name}')
         else:
             dates_to_download.append(date)
 
     if len(dates_to_download) != 0:
-        driver_path = ChromeDriverManager().install()
+        # 'selenium' is the original Chrome based downloader, 'http' fetches the files directly
+        if method == 'selenium':
+            download_with_selenium(dates_to_download, generator_names)
+        else:
+            failed_dates = fetch_price_files(dates_to_download, generator_names, base_url=base_url, max_workers=max_workers)
+
+        # Only split the days that arrived, the failed ones are reported below
+        save_generator_prices([date for date in dates_to_download if date not in failed_dates], generator_names)
+
+        # Days missing from the monthly archive, or without rows for a generator, have no file either
+        failed_dates = [date for date in dates_to_download
+                        if date in failed_dates or len(missing_generators(date, generator_names)) > 0]
 
-        chrome_options = webdriver.ChromeOptions()
-        prefs = {'download.default_directory': download_directory}
-        chrome_options.add_experimental_option('prefs', prefs)
+    # Say which days are missing here rather than letting reading the prices fail later
+    if len(failed_dates) > 0:
+        print(f"\n -- No price data for {len(failed_dates)} days: {', '.join(failed_dates)} -- \n\n")
+    else:
+        print("\n -- Price data downloaded successfully! -- \n\n")
+
+    return failed_dates
+
+# Original downloader, clicks through P-2Blist.htm in Chrome
+def download_with_selenium(dates_to_download, generator_names=None):
+    import requests
+    from selenium import webdriver
+    from webdriver_manager.chrome import ChromeDriverManager
+
+    driver_path = ChromeDriverManager().install()
+
+    chrome_options = webdriver.ChromeOptions()
+    prefs = {'download.default_directory': download_directory}
+    chrome_options.add_experimental_option('prefs', prefs)
 
-        # Initialize the driver, use try except blocks depending on version of selenium installed
+    # Initialize the driver, use try except blocks depending on version of selenium installed
+    try:
+        # Older selenium version that takes executable path as argument
+        driver = webdriver.Chrome(executable_path=driver_path, options=chrome_options)
+    except:
         try:
-            # Older selenium version that takes executable path as argument
-            driver = webdriver.Chrome(executable_path=driver_path, options=chrome_options)
+            # For selenium version 3.141.0 or above
+            driver=webdriver.Chrome(options=chrome_options)
         except:
-            try:
-                # For selenium version 3.141.0 or above
-                driver=webdriver.Chrome(options=chrome_options)
-            except:
-                sys.exit("Please install correct version of selenium")
+            sys.exit("Please install correct version of selenium")
+
+    driver.get('http://mis.nyiso.com/public/P-2Blist.htm')
+    all_links = driver.find_elements("xpath", "//a[@href]")
+
+    if not os.path.exists(download_directory):
+        os.makedirs(download_directory)
+
+    zip_dates = []
+
+    for date in dates_to_download:
+        found = False
+        i = 0
 
-        driver.get('http://mis.nyiso.com/public/P-2Blist.htm')
-        all_links = driver.find_elements("xpath", "//a[@href]")
+        if os.path.exists(f'{storage_directory}/{date}damlbmp_gen.csv'):
+            print(f'...Price data already downloaded for date: {date}')
+            found = True
 
-        if not os.path.exists(download_directory):
-            os.makedirs(download_directory)
+        while (not found) and (i < len(all_links)):
+            link = all_links[i]
+            href = link.get_attribute('href')
 
-        for date in dates_to_download:
-            found = False
-            i = 0
+            if ('csv' in href) and (date in href) and ('zip' not in href) and ('realtime' not in href):
+                link.click()
+                time.sleep(3)
+
+                print(download_directory)
+
+                file_name = extract_name(href)
+                destination_path = f'{storage_directory}/{file_name}'
+
+                if not os.path.exists(destination_path):
+                    source_path = f'{download_directory}/{file_name}'
+
+                    # Move the file using shutil.move()
+                    shutil.move(source_path, destination_path)
 
-            if os.path.exists(f'{storage_directory}/{date}damlbmp_gen.csv'):
-                print(f'...Price data already downloaded for date: {date}')
                 found = True
 
-            while (not found) and (i < len(all_links)):
-                link = all_links[i]
-                href = link.get_attribute('href')
+            i += 1
+
+        if not found:
+            zip_dates.append(date)
 
-                if ('csv' in href) and (date in href) and ('zip' not in href) and ('realtime' not in href):
-                    link.click()
-                    time.sleep(3)
+    driver.quit()
 
-                    print(download_directory)
+    # Days only published in the monthly archive, fetch each month's zip once
+    for year_month in sorted({date[0:6] for date in zip_dates}):
+        response = requests.get(monthly_zip_url(year_month), timeout=10)
 
-                    file_name = extract_name(href)
-                    destination_path = f'{storage_directory}/{file_name}'
+        # Check if the request was successful
+        if response.status_code == 200:
+            try:
+                month_dates = [date for date in zip_dates if date[0:6] == year_month]
+                ingest_monthly_zip(io.BytesIO(response.content), month_dates, generator_names)
+                print(f'successfully read zip file for month: {year_month}')
 
-                    if not os.path.exists(destination_path):
-                        source_path = f'{download_directory}/{file_name}'
+            except zipfile.BadZipFile:
+                print("Failed to extract the zip file - please try again")
+                sys.exit(1)
 
-                        # Move the file using shutil.move()
-                        shutil.move(source_path, destination_path)
+        else:
+            print("Failed to download the zip file")
 
-                    found = True
+# Names of the generators that still need a {date}_{generator}.csv file ('all' can't be checked
+# without reading the day's file, so it only counts as done once the day's file has been split)
+def missing_generators(date, generator_names):
+    if generator_names == 'all':
+        return 'all' if not os.path.exists(f'{storage_directory}/{date}_all.done') else []
 
-                i += 1
+    return [name for name in generator_names if not os.path.exists(f'{storage_directory}/{date}_{name}.csv')]
 
-            if not found:
-                year_month = date[0:6]
-                zip_url = f'http://mis.nyiso.com/public/csv/damlbmp/{year_month}01damlbmp_gen_csv.zip'
-                response = requests.get(zip_url, timeout=10)
+# Split one daily damlbmp_gen file into {date}_{generator}.csv files in a single pass. The file
+# is read in chunks so memory stays flat however many generators are kept.
+def split_daily_file(source, date, generator_names='all', chunksize=100000):
+    import pandas as pd
 
-                # Check if the request was successful
-                if response.status_code == 200:
-                    try:
-                        # Save the zip file to the destination folder
-                        print("Trying to download zip file...")
-                        with open(os.path.join(storage_directory, "month.zip"), "wb") as zip_file:
-                            zip_file.write(response.content)
-                            print('successfully downloaded zip file')
+    wanted = None if generator_names == 'all' else set(generator_names)
+    written = set()
 
-                        # Extract the downloaded zip file
-                        print("Trying to extract zip file...")
-                        with zipfile.ZipFile(os.path.join(storage_directory, "month.zip"), 'r') as zip_ref:
-                            zip_ref.extractall(storage_directory)
-                            print('successfully extracted zip file')
+    for chunk in pd.read_csv(source, usecols=['Name'] + columns, chunksize=chunksize):
+        if wanted is not None:
+            chunk = chunk[chunk['Name'].isin(wanted)]
 
-                        # Remove the downloaded zip file
-                        os.remove(os.path.join(storage_directory, "month.zip"))
-                        print('successfully removed zip file')
+        chunk = chunk.rename(columns=new_columns)
 
-                    except:
-                        print("Failed to extract the zip file - please try again")
-                        sys.exit(1)
+        for name, generator_df in chunk.groupby('Name', sort=False):
+            # Overwrite any partial file from an earlier run on the first write, append after that
+            generator_df[list(new_columns.values())].to_csv(f'{storage_directory}/{date}_{name}.csv.part',
+                mode='a' if name in written else 'w', header=name not in written, index=False)
+            written.add(name)
 
-                else:
-                    print("Failed to download the zip file")
+    for name in written:
+        os.replace(f'{storage_directory}/{date}_{name}.csv.part', f'{storage_directory}/{date}_{name}.csv')
 
+    if generator_names == 'all':
+        open(f'{storage_directory}/{date}_all.done', 'w').close()
 
-        driver.quit()
+    return sorted(written)
 
-        for date in date_range:
-            file_path = f'{storage_directory}/{date}_{generator_name}.csv'
+# Pull the rows of one or more generators (or 'all') out of the daily files into
+# {date}_{generator}.csv, reading each daily file once however many generators are wanted
+def save_generator_prices(date_range, generator_names, chunksize=100000):
+    if generator_names != 'all' and isinstance(generator_names, str):
+        generator_names = [generator_names]
+
+    for date in date_range:
+        missing = missing_generators(date, generator_names)
+        source_path = f'{storage_directory}/{date}damlbmp_gen.csv'
 
-            if not os.path.exists(file_path):
-                price_df = pd.read_csv(f'{storage_directory}/{date}damlbmp_gen.csv')
+        if len(missing) == 0:
+            continue
 
-                price_df = price_df[price_df['Name'] == generator_name][columns].reset_index(drop=True)
-                price_df = price_df.rename(columns=new_columns)
+        if not os.path.exists(source_path):
+            print(f'...No price data available for date: {date}')
+            continue
 
-                # Save dfs in data dir
-                print(f'Saving price data for date: {date}, Generator: {generator_name}')
-                price_df.to_csv(f'{storage_directory}/{date}_{generator_name}.csv', index=False)
+        written = split_daily_file(source_path, date, missing, chunksize)
 
-    print("\n -- Price data downloaded successfully! -- \n\n")
+        # Save dfs in data dir
+        print(f'Saving price data for date: {date}, Generators: {len(written)}')
 
 
-def extract_time_series_prices(date_range, generator, return_df=False, aggregation=None, extended=False):
+# Named aggregations, anything else is passed to pandas resample as a rule (e.g. '4h')
+aggregation_rules = {
+    'hourly': timedelta(hours=1),
+    'daily': timedelta(days=1)
+}
+
+# Hours repeated or skipped by daylight saving changes (or gaps in the data)
+def find_irregular_hours(times):
+    import pandas as pd
+
+    times = pd.DatetimeIndex(times)
+
+    duplicate_times = times[times.duplicated()].unique()
+
+    if len(times) == 0:
+        missing_times = times
+    else:
+        expected = pd.date_range(times.min().floor('D'), times.max().floor('D') + pd.Timedelta(hours=23), freq=pd.Timedelta(hours=1))
+        missing_times = expected.difference(times)
+
+    return duplicate_times.values, missing_times.values
+
+def report_irregular_hours(generator, times):
+    duplicate_times, missing_times = find_irregular_hours(times)
+
+    if len(duplicate_times) > 0 or len(missing_times) > 0:
+        print(f'...{generator}: {len(duplicate_times)} repeated and {len(missing_times)} missing hours (DST or gaps)')
+
+    return duplicate_times, missing_times
+
+# Times and price columns of the price matrix for the dates, as float32 slices of the mapped
+# file (views when the dates are consecutive). Hours any of the generators has no data for are
+# NaN in the matrix and left out, which copies only when there are some.
+def read_matrix_prices(generators, dates):
+    from price_matrix import read_prices
+
+    matrix_prices = read_prices(generators, dates)
+
+    missing = np.isnan(matrix_prices['LB_MargPrice'])
+    if missing.ndim == 2:
+        missing = missing.any(axis=0)
+
+    if missing.any():
+        matrix_prices = {name: values[..., ~missing] for name, values in matrix_prices.items()}
+
+    return matrix_prices
+
+# Returns the prices for the dates in order, with the times parsed to datetime64. With an
+# aggregation the prices are resampled to it (mean over each bin), which also merges the
+# repeated hour when clocks go back. From the price matrix the prices are float32.
+def extract_time_series_prices(date_range, generator, return_df=False, aggregation=None, extended=False, source='csv'):
+    import pandas as pd
+
     result = None
 
-    dfs = []
+    if source == 'store':
+        # Imported here, price_store itself imports this module
+        from price_store import read_prices
 
-    for date in date_range:
+        # The store is queried by range, extended ranges are [start_date, end_date]
+        if extended:
+            prices_df = read_prices(generator, date_range[0], date_range[1])
+        else:
+            prices_df = read_prices(generator, min(date_range), max(date_range))
+            prices_df = prices_df[prices_df['time'].dt.strftime('%Y%m%d').isin(date_range)]
+
+        prices_df = prices_df.drop(columns='generator')
+
+    elif source == 'matrix':
+        dates = date_range
+        if extended:
+            dates = [date.strftime('%Y%m%d') for date in pd.date_range(date_range[0], date_range[1])]
+
+        matrix_prices = read_matrix_prices(generator, dates)
+
+        # Without an aggregation the float32 slices of the mapped matrix are returned as they are
+        if aggregation is None and not return_df:
+            duplicate_times, missing_times = report_irregular_hours(generator, matrix_prices['times'])
+
+            return {
+                'times': matrix_prices['times'],
+                'prices': matrix_prices['LB_MargPrice'],
+                'marg_cost_loss': matrix_prices['MargCostLosses'],
+                'marg_cost_cong': matrix_prices['MargCostCongestion'],
+                'duplicate_times': duplicate_times,
+                'missing_times': missing_times
+            }
+
+        prices_df = pd.DataFrame({'time': matrix_prices['times'],
+                                  **{column: matrix_prices[column] for column in new_columns.values() if column != 'time'}})
+
+    else:
+        # Extended ranges are [start_date, end_date] of a file made by create_extended_time_series
         if extended:
-            prices_df = pd.read_csv(f'{storage_directory}/extended_time_series/{date[0]}_{date[1]}_{generator}.csv')
+            prices_df = pd.read_csv(extended_time_series_path(date_range[0], date_range[1], generator))
         else:
-            prices_df = pd.read_csv(f'{storage_directory}/{date}_{generator}.csv')
+            prices_df = pd.concat([pd.read_csv(f'{storage_directory}/{date}_{generator}.csv') for date in date_range])
 
-        dfs.append(prices_df)
+        prices_df['time'] = parse_times(prices_df['time'])
 
-    prices_df = pd.concat(dfs)
+    # Ensure that the prices are in order, stable so repeated DST hours keep their file order
+    prices_df = prices_df.sort_values(by='time', kind='stable').reset_index(drop=True)
 
-    # Ensure that the prices are in order
-    prices_df = prices_df.sort_values(by='time').reset_index(drop=True)
+    duplicate_times, missing_times = report_irregular_hours(generator, prices_df['time'])
+
+    if aggregation is not None:
+        rule = aggregation_rules.get(aggregation, aggregation)
+
+        prices_df = prices_df.set_index('time').resample(rule).mean().dropna(how='all').reset_index()
 
     if return_df:
         result = prices_df
     else:
-        # Extract the prices
+        # Extract the prices as contiguous arrays
         times = prices_df['time'].values
-        prices = prices_df['LB_MargPrice'].values
-        marg_cost_loss = prices_df['MargCostLosses'].values
-        marg_cost_cong = prices_df['MargCostCongestion'].values
+        prices = np.ascontiguousarray(prices_df['LB_MargPrice'].values, dtype=np.float64)
+        marg_cost_loss = np.ascontiguousarray(prices_df['MargCostLosses'].values, dtype=np.float64)
+        marg_cost_cong = np.ascontiguousarray(prices_df['MargCostCongestion'].values, dtype=np.float64)
 
         result = {
             'times': times,
             'prices': prices,
             'marg_cost_loss': marg_cost_loss,
-            'marg_cost_cong': marg_cost_cong
+            'marg_cost_cong': marg_cost_cong,
+            'duplicate_times': duplicate_times,
+            'missing_times': missing_times
         }
 
     return result
 
 
+# Prices of several generators as (generators x hours) matrices, read from the same files or
+# store as extract_time_series_prices but concatenated, parsed and sorted once for all of them.
+# Generators with different hours are lined up on the hours they all have. From the price
+# matrix they are its float32 slices.
+def extract_price_matrix(date_range, generator_names, source='csv'):
+    import pandas as pd
+
+    generator_names = list(generator_names)
+    value_columns = ['LB_MargPrice', 'MargCostLosses', 'MargCostCongestion']
+
+    if source == 'matrix':
+        matrix_prices = read_matrix_prices(generator_names, date_range)
+
+        return {
+            'times': matrix_prices['times'],
+            'prices': matrix_prices['LB_MargPrice'],
+            'marg_cost_loss': matrix_prices['MargCostLosses'],
+            'marg_cost_cong': matrix_prices['MargCostCongestion'],
+            'generator_names': generator_names
+        }
+
+    if source == 'store':
+        from price_store import read_prices
+
+        prices_df = read_prices(generator_names, min(date_range), max(date_range))
+        prices_df = prices_df[prices_df['time'].dt.strftime('%Y%m%d').isin(date_range)]
+    else:
+        prices_df = pd.concat([pd.read_csv(f'{storage_directory}/{date}_{generator}.csv').assign(generator=generator)
+                               for generator in generator_names for date in date_range], ignore_index=True)
+        prices_df['time'] = parse_times(prices_df['time'])
+
+    prices_df = prices_df.sort_values(by=['generator', 'time'], kind='stable')
+    groups = dict(list(prices_df.groupby('generator', sort=False)))
+
+    missing = [generator for generator in generator_names if generator not in groups]
+    if len(missing) > 0:
+        raise ValueError(f'No price data for generators: {", ".join(missing)}')
+
+    times = groups[generator_names[0]]['time'].values
+
+    if all(np.array_equal(groups[generator]['time'].values, times) for generator in generator_names):
+        matrices = [np.vstack([groups[generator][column].values for generator in generator_names]).astype(np.float64)
+                    for column in value_columns]
+    else:
+        # Repeated DST hours can't be lined up by time, so average them first
+        frame = prices_df.pivot_table(index='time', columns='generator', values=value_columns, aggfunc='mean').dropna()
+
+        times = frame.index.values
+        matrices = [frame[column][generator_names].values.T.astype(np.float64) for column in value_columns]
+
+    return {
+        'times': times,
+        'prices': np.ascontiguousarray(matrices[0]),
+        'marg_cost_loss': np.ascontiguousarray(matrices[1]),
+        'marg_cost_cong': np.ascontiguousarray(matrices[2]),
+        'generator_names': generator_names
+    }
+
+# Prices for the model: one generator_name gives the series of extract_time_series_prices,
+# a list of generator names gives the (generators x hours) matrices of extract_price_matrix
+def extract_model_prices(date_range, generator_name, source='csv'):
+    if isinstance(generator_name, str):
+        return extract_time_series_prices(date_range, generator_name, aggregation=None, source=source)
+
+    return extract_price_matrix(date_range, generator_name, source=source)
+
+# Download the days of date_range (default parameters['date_range']) of parameters['generator_name']
+# that aren't stored yet, when parameters['price_source'] is 'csv' ('store' and 'matrix' read
+# prices already imported locally). Returns the days that couldn't be downloaded.
+def download_prices(parameters, date_range=None):
+    if parameters.get('price_source', 'csv') != 'csv':
+        return []
+
+    date_range = parameters['date_range'] if date_range is None else date_range
+
+    return download_price_data(date_range, parameters['generator_name'])
+
+# Model prices of parameters['generator_name'] for date_range (default parameters['date_range'])
+# from parameters['price_source'], downloading them first unless download is False. With stats
+# the download and parse are timed as stages of a run.
+def load_prices(parameters, date_range=None, stats=None, download=True):
+    date_range = parameters['date_range'] if date_range is None else date_range
+    price_source = parameters.get('price_source', 'csv')
+    trace_memory = parameters.get('trace_memory', False)
+
+    def timed(name):
+        return nullcontext() if stats is None else stage(stats, name, trace_memory)
+
+    if download and price_source == 'csv':
+        with timed('download'):
+            download_prices(parameters, date_range)
+
+    with timed('parse'):
+        return extract_model_prices(date_range, parameters['generator_name'], source=price_source)
+
+def parse_times(times):
+    import pandas as pd
+
+    # NYISO time stamps are 'MM/DD/YYYY HH:MM', fall back to inference for anything else
+    try:
+        return pd.to_datetime(times, format='%m/%d/%Y %H:%M')
+    except ValueError:
+        return pd.to_datetime(times)
+
+def extended_time_series_path(start_date, end_date, generator_name):
+    return f'{storage_directory}/extended_time_series/{start_date}_{end_date}_{generator_name}.csv'
+
+# Existing extended series for a generator as (start_date, end_date, path)
+def find_extended_time_series(generator_name):
+    file_pattern = re.compile(r'^(\d{8})_(\d{8})_(.+)\.csv$')
+    found = []
+
+    for path in glob.glob(f'{storage_directory}/extended_time_series/*.csv'):
+        match = file_pattern.match(os.path.basename(path))
+
+        if match and match.group(3) == generator_name:
+            found.append((match.group(1), match.group(2), path))
+
+    return found
+
+# Read the daily price files for a list of 'YYYYMMDD' dates in one batch
+def read_daily_prices(dates, generator_name):
+    import pandas as pd
+
+    dfs = []
+
+    for date in dates:
+        file_path = f'{storage_directory}/{date}_{generator_name}.csv'
+
+        # Fall back to the realtime file in downloads if the daily file was never split out
+        if not os.path.exists(file_path) and os.path.exists(f'{storage_directory}/downloads/{date}realtime_gen.csv'):
+            price_df = pd.read_csv(f'{storage_directory}/downloads/{date}realtime_gen.csv')
+            price_df = price_df[price_df['Name'] == generator_name][columns].reset_index(drop=True)
+            price_df = price_df.rename(columns=new_columns)
+
+            price_df.to_csv(file_path, index=False)
+
+        if os.path.exists(file_path):
+            dfs.append(pd.read_csv(file_path))
+        else:
+            print(f'...No price data available for date: {date}, Generator: {generator_name}')
+
+    if len(dfs) == 0:
+        return pd.DataFrame(columns=list(new_columns.values()))
+
+    return pd.concat(dfs, ignore_index=True)
+
 def create_extended_time_series(start_date, end_date, generator_name, aggregation=None):
-    result = None
+    import pandas as pd
+
+    output_path = extended_time_series_path(start_date, end_date, generator_name)
 
     # Check if already done:
-    if os.path.exists(f'{storage_directory}/extended_time_series/{start_date}_{end_date}_{generator_name}.csv'):
+    if os.path.exists(output_path):
         print(f'Extended time series already created for dates:\
             {start_date} to {end_date}, Generator: {generator_name}')
         # Read in and return df
-        result = pd.read_csv(f'{storage_directory}/extended_time_series/{start_date}_{end_date}_{generator_name}.csv')
-    else:
-        # create list of dates between start_date and end_date inclusive
-        date_list = pd.date_range(start=start_date, end=end_date).tolist()
+        return pd.read_csv(output_path)
 
-        full_df = None
+    start = pd.Timestamp(start_date)
+    end = pd.Timestamp(end_date) + pd.Timedelta(days=1)
 
-        for date in date_list:
-            print("Fetching price data for date: ", date)
-            date_formatted = date.strftime("%Y%m%d")
+    date_list = [date.strftime('%Y%m%d') for date in pd.date_range(start=start_date, end=end_date)]
 
-            # Try to read it in from data dir
-            if os.path.exists(f'{storage_directory}/{date_formatted}_{generator_name}.csv'):
-                price_df = pd.read_csv(f'{storage_directory}/{date_formatted}_{generator_name}.csv')
+    # Start from the existing series that covers the most of the range, so only new days are read
+    existing_df = None
+    best_overlap = 0
 
-                # Concat it to full_df
-                if full_df is None:
-                    full_df = price_df
-                else:
-                    full_df = pd.concat([full_df, price_df], axis=0)
+    for existing_start, existing_end, path in find_extended_time_series(generator_name):
+        overlap = sum(existing_start <= date <= existing_end for date in date_list)
 
-            # Try to read it in from downloads
-            if os.path.exists(f'{storage_directory}/downloads/{date_formatted}realtime_gen.csv'):
-                price_df = pd.read_csv(f'{storage_directory}/downloads/{date_formatted}realtime_gen.csv')
-                price_df = price_df[price_df['Name'] == generator_name][columns].reset_index(drop=True)
+        if overlap > best_overlap:
+            best_overlap = overlap
+            covered = (existing_start, existing_end)
+            existing_path = path
 
-                price_df = price_df.rename(columns=new_columns)
+    if best_overlap > 0:
+        print(f'Extending time series for dates: {covered[0]} to {covered[1]}, Generator: {generator_name}')
 
-                price_df.to_csv(f'{storage_directory}/{date_formatted}_{generator_name}.csv', index=False)
+        existing_df = pd.read_csv(existing_path)
+        date_list = [date for date in date_list if not covered[0] <= date <= covered[1]]
 
-                # Concat it to full_df
-                if full_df is None:
-                    full_df = price_df
-                else:
-                    full_df = pd.concat([full_df, price_df], axis=0)
+    print(f'Fetching price data for {len(date_list)} dates')
+    full_df = pd.concat([existing_df, read_daily_prices(date_list, generator_name)], ignore_index=True)
 
-        # Save extended time series
-        result = full_df.to_csv(f'Data/extended_time_series/{start_date}_{end_date}_{generator_name}.csv', index=False)
+    # Parse the timestamps once to sort and cut to the requested range. The new days are the
+    # ones the existing series doesn't cover, so there is nothing to de-duplicate (and the hour
+    # repeated when clocks go back has the same local time twice, so times can't be used to).
+    times = parse_times(full_df['time'])
+    full_df = full_df[(times >= start) & (times < end)].assign(datetime=times)
+    full_df = full_df.sort_values(by='datetime', kind='stable')
+    full_df = full_df.drop(columns='datetime').reset_index(drop=True)
 
-    return result
+    # Save extended time series
+    if not os.path.exists(f'{storage_directory}/extended_time_series'):
+        os.makedirs(f'{storage_directory}/extended_time_series')
 
+    full_df.to_csv(output_path, index=False)
 
+    return full_df